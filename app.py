@@ -1,14 +1,16 @@
 import streamlit as st
-import pandas as pd
 import os
 import sys
-import traceback
 
 # Use pathlib for more robust path handling
 from pathlib import Path
 
 # Modify the import to use local utils
-from utils import load_model, predict_with_model
+from utils import configure_prediction_cache, get_prediction_cache, predict_plans
+from instrumentation import configure_instrumentation, get_metrics
+from registry import MODEL_FILES, default_registry, get_model, model_stats, warm_up
+from profiles import (ACTIVITY_LEVELS, AGE_RANGE, ALLERGIES, CUISINES, DIETARY_RESTRICTIONS, DISEASE_TYPES,
+                      FITNESS_GOALS, GENDERS, HEIGHT_RANGE, SEVERITIES, WEIGHT_RANGE, Profile, calculate_bmi)
 
 # Use a relative path for the model directory
 BASE_DIR = Path(__file__).parent
@@ -17,22 +19,52 @@ MODEL_DIR = BASE_DIR / "model"
 # Ensure model directory exists
 MODEL_DIR.mkdir(exist_ok=True)
 
+# Cache predictions for repeated profiles; app.py reruns on every interaction,
+# so only create the cache once per process
+if get_prediction_cache() is None:
+    configure_prediction_cache(maxsize=10000, ttl=3600)
+
+# Prediction counters and stage timings, shown under "Debug Information"
+if get_metrics() is None:
+    configure_instrumentation()
+
+# Names of the plans' models in messages
+PLAN_NAMES = {"workout_plan": "workout", "diet_plan": "diet"}
+
+# Load the models on a background thread while the page renders; a submit
+# that arrives before they are ready waits for the warm-up instead of
+# loading them again
+warm_up(MODEL_FILES.values())
+
+# Contributions listed under "Why this plan?"
+TOP_FACTORS = 5
+
 # Debugging: Check if model files exist
 def check_model_files():
-    model_files = ["diet_model.pkl", "gym_model.pkl"]
     results = {}
 
-    for file in model_files:
+    for file in MODEL_FILES.values():
         path = MODEL_DIR / file
         results[file] = path.exists()
 
     return results
 
 
-# Function to calculate BMI
-def calculate_bmi(weight_kg, height_cm):
-    height_m = height_cm / 100
-    return round(weight_kg / (height_m * height_m), 2)
+def show_explanation(explanation):
+    """Show the plan's probability and the features that contributed most to it."""
+    if explanation is None:
+        # The model cannot be explained (e.g. a compact forest)
+        return
+    probabilities = explanation["probabilities"]
+    st.write(f"Confidence: {probabilities[explanation['label']]:.0%}")
+    with st.expander("Why this plan?"):
+        st.write("Probability of each plan:")
+        st.dataframe([{"plan": label, "probability": round(probability, 3)}
+                      for label, probability in sorted(probabilities.items(), key=lambda item: -item[1])])
+        st.write(f"Top factors, starting from a base rate of {explanation['bias']:.0%}:")
+        factors = list(explanation["contributions"].items())[:TOP_FACTORS]
+        st.dataframe([{"feature": feature, "value": explanation["values"][feature],
+                       "contribution": round(contribution, 3)} for feature, contribution in factors])
 
 
 # Streamlit Page Configuration
@@ -52,21 +84,30 @@ with st.expander("Debug Information"):
     st.write("Current Directory:", os.getcwd())
     st.write("Python Version:", sys.version)
 
-# Try to load the models
-models_loaded = {"diet": False, "gym": False}
-try:
-    diet_model = load_model("diet_model.pkl")
-    models_loaded["diet"] = True
-    st.success("Diet model loaded successfully!")
-except Exception as e:
-    st.error(f"Failed to load diet model: {str(e)}")
-
-try:
-    gym_model = load_model("gym_model.pkl")
-    models_loaded["gym"] = True
-    st.success("Gym model loaded successfully!")
-except Exception as e:
-    st.error(f"Failed to load gym model: {str(e)}")
+    st.write("Prediction Metrics (this process):")
+    metrics_summary = get_metrics().summary()
+    if metrics_summary:
+        st.dataframe(metrics_summary)
+        st.download_button("Download metrics (Prometheus format)", get_metrics().render_prometheus(),
+                           file_name="metrics.txt")
+    else:
+        st.write("No predictions yet")
+
+# Report the models' state without waiting for the warm-up
+for output, filename in MODEL_FILES.items():
+    name = PLAN_NAMES[output]
+    if default_registry.entry(filename) is not None:
+        st.success(f"{name.capitalize()} model loaded successfully!")
+    elif default_registry.error(filename):
+        st.error(f"Failed to load {name} model: {default_registry.error(filename)}")
+    else:
+        st.info(f"Loading {name} model...")
+
+# Load time and memory of the models cached in this process
+with st.expander("Model Registry"):
+    for stats in model_stats():
+        st.write(stats)
+    st.write("Prediction cache:", get_prediction_cache().stats())
 
 # Form to collect user input
 with st.form("user_form"):
@@ -74,12 +115,12 @@ with st.form("user_form"):
 
     col1, col2 = st.columns(2)
     with col1:
-        age = st.number_input("Age", 10, 100, 25)
-        weight = st.number_input("Weight (kg)", 30.0, 200.0, 70.0)
-        gender = st.selectbox("Gender", ["Male", "Female"])
+        age = st.number_input("Age", *AGE_RANGE, 25)
+        weight = st.number_input("Weight (kg)", *WEIGHT_RANGE, 70.0)
+        gender = st.selectbox("Gender", GENDERS)
     with col2:
-        height = st.number_input("Height (cm)", 100.0, 250.0, 170.0)
-        fitness_goal = st.selectbox("Fitness Goal", ["Lose Weight", "Gain Muscle", "Maintain Fitness"])
+        height = st.number_input("Height (cm)", *HEIGHT_RANGE, 170.0)
+        fitness_goal = st.selectbox("Fitness Goal", FITNESS_GOALS)
 
     # Calculate BMI
     bmi = calculate_bmi(weight, height)
@@ -91,16 +132,16 @@ with st.form("user_form"):
     col1, col2 = st.columns(2)
     with col1:
         disease_type = st.multiselect("Medical Conditions",
-                                      ["None", "Diabetes", "Hypertension", "Obesity"],
+                                      DISEASE_TYPES,
                                       default=["None"])
 
         severity = st.selectbox("Condition Severity",
-                                ["None", "Mild", "Moderate", "Severe"],
+                                SEVERITIES,
                                 index=0)
 
     with col2:
         activity_level = st.selectbox("Physical Activity Level",
-                                      ["Sedentary", "Moderate", "Active"],
+                                      ACTIVITY_LEVELS,
                                       index=1)
 
     # Dietary Preferences
@@ -109,105 +150,44 @@ with st.form("user_form"):
     col1, col2 = st.columns(2)
     with col1:
         dietary_restrictions = st.multiselect("Dietary Restrictions",
-                                              ["None", "Low_Sodium", "Low_Sugar"],
+                                              DIETARY_RESTRICTIONS,
                                               default=["None"])
 
         allergies = st.multiselect("Allergies",
-                                   ["None", "Gluten", "Peanuts"],
+                                   ALLERGIES,
                                    default=["None"])
 
     with col2:
         preferred_cuisine = st.multiselect("Preferred Cuisine",
-                                           ["None", "Chinese", "Indian", "Italian", "Mexican"],
+                                           CUISINES,
                                            default=["None"])
 
     submitted = st.form_submit_button("💡 Get Recommendations")
 
 # When the form is submitted
 if submitted:
-    if not (models_loaded["diet"] or models_loaded["gym"]):
+    # Waits for the warm-up if a model is still loading
+    loaded = {}
+    for output, filename in MODEL_FILES.items():
+        try:
+            loaded[output] = get_model(filename)
+        except Exception as e:
+            st.error(f"Failed to load {PLAN_NAMES[output]} model: {str(e)}")
+    models_loaded = {output: output in loaded for output in MODEL_FILES}
+
+    if not (models_loaded["diet_plan"] or models_loaded["workout_plan"]):
         st.warning("Cannot generate recommendations because models failed to load.")
     else:
-        # Process inputs to handle multiselects properly
-        has_diabetes = 1 if "Diabetes" in disease_type and "None" not in disease_type else 0
-        has_hypertension = 1 if "Hypertension" in disease_type and "None" not in disease_type else 0
-        has_obesity = 1 if "Obesity" in disease_type and "None" not in disease_type else 0
-
-        is_mild = 1 if severity == "Mild" else 0
-        is_moderate = 1 if severity == "Moderate" else 0
-        is_severe = 1 if severity == "Severe" else 0
-
-        is_active = 1 if activity_level == "Active" else 0
-        is_moderate_activity = 1 if activity_level == "Moderate" else 0
-        is_sedentary = 1 if activity_level == "Sedentary" else 0
-
-        has_low_sodium = 1 if "Low_Sodium" in dietary_restrictions and "None" not in dietary_restrictions else 0
-        has_low_sugar = 1 if "Low_Sugar" in dietary_restrictions and "None" not in dietary_restrictions else 0
-
-        has_gluten_allergy = 1 if "Gluten" in allergies and "None" not in allergies else 0
-        has_peanut_allergy = 1 if "Peanuts" in allergies and "None" not in allergies else 0
-
-        likes_chinese = 1 if "Chinese" in preferred_cuisine and "None" not in preferred_cuisine else 0
-        likes_indian = 1 if "Indian" in preferred_cuisine and "None" not in preferred_cuisine else 0
-        likes_italian = 1 if "Italian" in preferred_cuisine and "None" not in preferred_cuisine else 0
-        likes_mexican = 1 if "Mexican" in preferred_cuisine and "None" not in preferred_cuisine else 0
-
         # Create user input with all required fields for the model
-        user_input = {
-            # Basic info
-            "Age": age,
-            "Gender_Male": 1 if gender == "Male" else 0,
-            "Gender_Female": 1 if gender == "Female" else 0,
-            "Weight_kg": weight,
-            "Height_cm": height,
-            "BMI": bmi,
-
-            # Also include alternate column names that might be in the model
-            "Weight": weight,
-            "Height": height,
-            "Sex_Male": 1 if gender == "Male" else 0,
-            "Sex_Female": 1 if gender == "Female" else 0,
-
-            # Health conditions
-            "Disease_Type_Diabetes": has_diabetes,
-            "Disease_Type_Hypertension": has_hypertension,
-            "Disease_Type_Obesity": has_obesity,
-            "Diabetes_Yes": has_diabetes,
-            "Hypertension_Yes": has_hypertension,
-
-            # Condition severity
-            "Severity_Mild": is_mild,
-            "Severity_Moderate": is_moderate,
-            "Severity_Severe": is_severe,
-
-            # Activity level
-            "Physical_Activity_Level_Active": is_active,
-            "Physical_Activity_Level_Moderate": is_moderate_activity,
-            "Physical_Activity_Level_Sedentary": is_sedentary,
-
-            # Dietary preferences
-            "Dietary_Restrictions_Low_Sodium": has_low_sodium,
-            "Dietary_Restrictions_Low_Sugar": has_low_sugar,
-            "Allergies_Gluten": has_gluten_allergy,
-            "Allergies_Peanuts": has_peanut_allergy,
-
-            # Cuisine preferences
-            "Preferred_Cuisine_Chinese": likes_chinese,
-            "Preferred_Cuisine_Indian": likes_indian,
-            "Preferred_Cuisine_Italian": likes_italian,
-            "Preferred_Cuisine_Mexican": likes_mexican,
-
-            # Fitness goals with multiple naming variations
-            "Fitness Goal_Lose Weight": 1 if fitness_goal == "Lose Weight" else 0,
-            "Fitness Goal_Gain Muscle": 1 if fitness_goal == "Gain Muscle" else 0,
-            "Fitness Goal_Maintain Fitness": 1 if fitness_goal == "Maintain Fitness" else 0,
-            "Fitness Goal_Weight Loss": 1 if fitness_goal == "Lose Weight" else 0,
-            "Fitness Goal_Weight Gain": 1 if fitness_goal == "Gain Muscle" else 0,
-        }
+        profile = Profile.from_form(age, weight, height, gender, fitness_goal, disease_type, severity,
+                                    activity_level, dietary_restrictions, allergies, preferred_cuisine)
+        has_diabetes = profile.diabetes
+        has_hypertension = profile.hypertension
+        is_sedentary = profile.sedentary
 
         # Display input data for debugging
         with st.expander("Debug: Input Data"):
-            st.write(user_input)
+            st.write(profile.to_dict())
 
             # Also show a nicely formatted summary of selections
             st.subheader("Your Selections Summary")
@@ -234,32 +214,39 @@ if submitted:
         # Try to predict plans
         st.success("✅ Here are your personalized plans!")
 
-        # Predict the gym plan
-        if models_loaded["gym"]:
+        # Predict and explain both plans from a single encoding of the profile
+        plans = predict_plans(loaded, profile, explain=True)
+
+        # Show the gym plan
+        if models_loaded["workout_plan"]:
             st.subheader("🏃 Your Workout Recommendation")
-            try:
-                gym_plan = predict_with_model(gym_model, user_input)
-                st.markdown(f"**Plan:** {gym_plan}")
-            except Exception as e:
-                st.error(f"Couldn't generate workout plan: {str(e)}")
+            if plans["workout_plan"]["error"] is None:
+                st.markdown(f"**Plan:** {plans['workout_plan']['label']}")
+                show_explanation(plans["workout_plan"]["explanation"])
+            else:
+                st.error(f"Couldn't generate workout plan: {plans['workout_plan']['error']}")
                 with st.expander("Error Details"):
-                    st.code(traceback.format_exc())
+                    st.code(plans["workout_plan"]["traceback"])
         else:
             st.warning("⚠️ Workout recommendation not available (model not loaded)")
 
-        # Predict the diet plan
-        if models_loaded["diet"]:
+        # Show the diet plan
+        if models_loaded["diet_plan"]:
             st.subheader("🥗 Your Diet Recommendation")
-            try:
-                diet_plan = predict_with_model(diet_model, user_input)
-                st.markdown(f"**Plan:** {diet_plan}")
-            except Exception as e:
-                st.error(f"Couldn't generate diet plan: {str(e)}")
+            if plans["diet_plan"]["error"] is None:
+                st.markdown(f"**Plan:** {plans['diet_plan']['label']}")
+                show_explanation(plans["diet_plan"]["explanation"])
+            else:
+                st.error(f"Couldn't generate diet plan: {plans['diet_plan']['error']}")
                 with st.expander("Error Details"):
-                    st.code(traceback.format_exc())
+                    st.code(plans["diet_plan"]["traceback"])
         else:
             st.warning("⚠️ Diet recommendation not available (model not loaded)")
 
+        with st.expander("Debug: Prediction Timings"):
+            for name, plan in plans.items():
+                st.write(f"- {name}: {plan['seconds'] * 1000:.2f} ms")
+
         # Add additional recommendations based on the user's inputs
         st.subheader("📝 Additional Recommendations")
 
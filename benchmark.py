@@ -0,0 +1,268 @@
+"""Benchmarks for model loading, feature mapping and prediction.
+
+Every case runs in a fresh process so its peak RSS can be measured on its
+own. Inputs are synthetic profiles drawn over the whole domain of the form
+in app.py (see profiles.random_profile). Batches of up to 10,000 rows are
+lists of input dicts, like score.py passes them; larger batches are
+DataFrames, which keeps a 1M-row batch to a few hundred MB.
+
+    python benchmark.py                            # writes benchmark_results.json
+    python benchmark.py --sizes 1 100 --save-baseline
+    python benchmark.py --baseline benchmark_baseline.json --max-slowdown 0.15
+
+Cases:
+    load       load_model, first call in a new process (cold) and repeated (warm)
+    mapping    feature mapping only (FeaturePlan.apply / apply_many)
+    predict    predict_with_model for single rows, predict_batch for batches,
+               with the pickled sklearn model and the compiled forest
+
+With a baseline, a case counts as a regression when its p50 or p95 latency
+grows by more than ``--max-slowdown`` or its peak RSS by more than
+``--max-rss-growth``; the script then exits with status 1.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+DEFAULT_SIZES = [1, 100, 10000, 1000000]
+ENGINES = ["sklearn", "compiled"]
+
+# Batches above this size are passed as a DataFrame instead of a list of dicts
+FRAME_THRESHOLD = 10000
+
+RESULTS_FILE = "benchmark_results.json"
+BASELINE_FILE = "benchmark_baseline.json"
+
+
+def synthetic_inputs(n, seed=0, as_frame=False):
+    """Return ``n`` encoded random profiles as a list of dicts or a DataFrame."""
+    from profiles import encode_profile, random_profile
+
+    rng = random.Random(seed)
+    if not as_frame:
+        return [encode_profile(**random_profile(rng)) for _ in range(n)]
+
+    import pandas as pd
+
+    # Build the frame in chunks so the intermediate dicts stay small
+    chunks = []
+    for start in range(0, n, FRAME_THRESHOLD):
+        size = min(FRAME_THRESHOLD, n - start)
+        chunks.append(pd.DataFrame([encode_profile(**random_profile(rng)) for _ in range(size)]))
+    return pd.concat(chunks, ignore_index=True)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _time_calls(call, args, min_time, min_repeats, max_repeats):
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < max_repeats:
+        arg = args[len(samples) % len(args)]
+        start = time.perf_counter()
+        call(arg)
+        samples.append(time.perf_counter() - start)
+        if len(samples) >= min_repeats and time.perf_counter() - started >= min_time:
+            break
+    return samples
+
+
+def run_case(case):
+    """Run one benchmark case in the current process; return its raw samples."""
+    from utils import load_model
+
+    kind = case["benchmark"]
+    min_time, min_repeats, max_repeats = case["min_time"], case["min_repeats"], case["max_repeats"]
+
+    if kind == "load":
+        start = time.perf_counter()
+        load_model(case["model"])
+        cold = time.perf_counter() - start
+        if case["mode"] == "cold":
+            return {"samples": [cold], "rows": 1, "peak_rss_mb": peak_rss_mb()}
+        samples = _time_calls(load_model, [case["model"]], min_time, min_repeats, max_repeats)
+        return {"samples": samples, "rows": 1, "peak_rss_mb": peak_rss_mb()}
+
+    from feature_plan import get_plan
+    from forest_engine import compile_model
+    from utils import predict_batch, predict_with_model
+
+    model = load_model(case["model"])
+    if case.get("engine") == "compiled":
+        model = compile_model(model)
+    plan = get_plan(model[2])
+
+    batch_size = case["batch_size"]
+    if batch_size == 1:
+        # A pool of distinct rows, cycled through by the timing loop
+        inputs = synthetic_inputs(1000, case["seed"])
+    else:
+        inputs = [synthetic_inputs(batch_size, case["seed"], as_frame=batch_size > FRAME_THRESHOLD)]
+
+    if kind == "mapping":
+        call = plan.apply if batch_size == 1 else plan.apply_many
+        samples = _time_calls(call, inputs, min_time, min_repeats, max_repeats)
+    elif batch_size == 1:
+        samples = _time_calls(lambda row: predict_with_model(model, row), inputs,
+                              min_time, min_repeats, max_repeats)
+    else:
+        samples = _time_calls(lambda batch: predict_batch(model, batch), inputs, min_time, min_repeats, max_repeats)
+    return {"samples": samples, "rows": batch_size, "peak_rss_mb": peak_rss_mb()}
+
+
+def run_isolated(case):
+    """Run ``case`` in a new process and return its raw samples."""
+    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as executor:
+        return executor.submit(run_case, case).result()
+
+
+def summarize(case, runs):
+    samples = np.array([s for run in runs for s in run["samples"]])
+    rows = runs[0]["rows"]
+    rss = [run["peak_rss_mb"] for run in runs if run["peak_rss_mb"] is not None]
+    result = {key: case[key] for key in ("benchmark", "model", "engine", "mode", "batch_size") if key in case}
+    result.update({
+        "input": "frame" if case.get("batch_size", 1) > FRAME_THRESHOLD else "records",
+        "repeats": len(samples),
+        "p50_ms": round(float(np.percentile(samples, 50)) * 1000, 4),
+        "p95_ms": round(float(np.percentile(samples, 95)) * 1000, 4),
+        "p99_ms": round(float(np.percentile(samples, 99)) * 1000, 4),
+        "mean_ms": round(float(samples.mean()) * 1000, 4),
+        "throughput_rows_s": round(rows * len(samples) / float(samples.sum()), 1),
+        "peak_rss_mb": round(max(rss), 1) if rss else None,
+    })
+    if case["benchmark"] == "load":
+        del result["input"]
+    return result
+
+
+def case_key(result):
+    return "/".join(str(result.get(key, "-")) for key in ("benchmark", "model", "engine", "mode", "batch_size"))
+
+
+def build_cases(models, sizes, engines, args):
+    timing = {"min_time": args.min_time, "min_repeats": args.min_repeats,
+              "max_repeats": args.max_repeats, "seed": args.seed}
+    cases = []
+    for model in models:
+        cases.append(dict(timing, benchmark="load", model=model, mode="cold"))
+        cases.append(dict(timing, benchmark="load", model=model, mode="warm"))
+        for size in sizes:
+            cases.append(dict(timing, benchmark="mapping", model=model, batch_size=size))
+        for engine in engines:
+            for size in sizes:
+                cases.append(dict(timing, benchmark="predict", model=model, engine=engine, batch_size=size))
+    return cases
+
+
+def environment():
+    import sklearn
+
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(results, baseline, max_slowdown, max_rss_growth):
+    """Return a list of regression messages for ``results`` against ``baseline``."""
+    previous = {case_key(result): result for result in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        before = previous.get(case_key(result))
+        if before is None:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            if before[metric] and result[metric] > before[metric] * (1 + max_slowdown):
+                regressions.append(f"{case_key(result)}: {metric} {before[metric]:.4g} -> {result[metric]:.4g}")
+        if before.get("peak_rss_mb") and result.get("peak_rss_mb") \
+                and result["peak_rss_mb"] > before["peak_rss_mb"] * (1 + max_rss_growth):
+            regressions.append(f"{case_key(result)}: peak_rss_mb {before['peak_rss_mb']} -> {result['peak_rss_mb']}")
+    return regressions
+
+
+def main(argv=None):
+    # Not imported at the top: the spawned case processes time cold imports
+    from registry import MODEL_FILES
+    from utils import MODEL_DIR
+
+    parser = argparse.ArgumentParser(description="Benchmark model loading, feature mapping and prediction.")
+    parser.add_argument("--models", nargs="+", default=list(MODEL_FILES.values()), help="model files in the model directory")
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES, help="batch sizes")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=ENGINES)
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds to spend timing each case")
+    parser.add_argument("--min-repeats", type=int, default=5)
+    parser.add_argument("--max-repeats", type=int, default=10000)
+    parser.add_argument("--cold-runs", type=int, default=5, help="new processes used for the cold load")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default=RESULTS_FILE, help="results file")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline to compare against, if it exists")
+    parser.add_argument("--save-baseline", action="store_true", help="also write the results as the baseline")
+    parser.add_argument("--max-slowdown", type=float, default=0.15, help="allowed relative p50/p95 increase")
+    parser.add_argument("--max-rss-growth", type=float, default=0.25, help="allowed relative peak RSS increase")
+    args = parser.parse_args(argv)
+
+    models = []
+    for model in args.models:
+        if os.path.exists(os.path.join(MODEL_DIR, model)):
+            models.append(model)
+        else:
+            print(f"Warning: skipping {model}, not found in {MODEL_DIR}", file=sys.stderr)
+    if not models:
+        print("No models to benchmark", file=sys.stderr)
+        return 1
+
+    results = []
+    for case in build_cases(models, args.sizes, args.engines, args):
+        runs = args.cold_runs if case.get("mode") == "cold" else 1
+        result = summarize(case, [run_isolated(case) for _ in range(runs)])
+        results.append(result)
+        print(f"{case_key(result):<42} p50 {result['p50_ms']:>10.3f} ms  p95 {result['p95_ms']:>10.3f} ms  "
+              f"p99 {result['p99_ms']:>10.3f} ms  {result['throughput_rows_s']:>12.1f} rows/s  "
+              f"peak RSS {result['peak_rss_mb']} MB", flush=True)
+
+    report = {"environment": environment(), "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    status = 0
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_slowdown, args.max_rss_growth)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        print(f"Compared with {args.baseline}: {len(regressions)} regression(s)")
+        status = 1 if regressions else 0
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote baseline {args.baseline}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
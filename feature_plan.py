@@ -0,0 +1,293 @@
+import math
+
+import numpy as np
+
+from profiles import INPUT_FIELDS, PROFILE_FIELDS
+
+# Rule kinds. A column's rules are tried in order and the first one whose
+# source key is present in the input decides the value; FLAG rules only
+# decide when the source equals 1, otherwise the next rule is tried.
+DIRECT = 0      # value = input[key]
+COMPLEMENT = 1  # value = 1 - input[key]
+FLAG = 2        # value = 1 if input[key] == 1
+
+# Families of one-hot columns in the diet model. The legacy mapping rebuilt
+# the source key from one part of the column name, which for multi-word
+# values (e.g. Dietary_Restrictions_Low_Sodium) points at a different key.
+DIET_FLAG_PREFIXES = [
+    ('Gender_', 1),
+    ('Disease_Type_', -1),
+    ('Severity_', 1),
+    ('Physical_Activity_Level_', -1),
+    ('Dietary_Restrictions_', -1),
+    ('Allergies_', 1),
+    ('Preferred_Cuisine_', 2),
+]
+
+# Gym model columns that are filled from the app's alternate names
+GYM_ALIASES = {
+    'Height': [(DIRECT, 'Height_cm')],
+    'Weight': [(DIRECT, 'Weight_kg')],
+    'Hypertension_Yes': [(DIRECT, 'Disease_Type_Hypertension')],
+    'Hypertension_No': [(COMPLEMENT, 'Disease_Type_Hypertension')],
+    'Diabetes_Yes': [(DIRECT, 'Disease_Type_Diabetes')],
+    'Diabetes_No': [(COMPLEMENT, 'Disease_Type_Diabetes')],
+}
+
+# Fitness goal names used by the gym model, checked before the column itself
+GYM_GOAL_ALIASES = {
+    'Fitness Goal_Weight Loss': 'Fitness Goal_Lose Weight',
+    'Fitness Goal_Weight Gain': 'Fitness Goal_Gain Muscle',
+}
+
+
+def is_diet_columns(feature_columns):
+    """Return True if the feature columns belong to the diet model."""
+    return 'Weight_kg' in feature_columns or any('Dietary_Restrictions' in col for col in feature_columns)
+
+
+def _diet_rules(col):
+    rules = [(DIRECT, col)]
+    for prefix, part in DIET_FLAG_PREFIXES:
+        if col.startswith(prefix):
+            source = prefix + col.split('_')[part]
+            if source != col:
+                rules.append((FLAG, source))
+            break
+    return rules
+
+
+def _gym_rules(col):
+    rules = []
+    if col in GYM_GOAL_ALIASES:
+        rules.append((DIRECT, GYM_GOAL_ALIASES[col]))
+    rules.append((DIRECT, col))
+    rules.extend(GYM_ALIASES.get(col, []))
+    if col.startswith('Sex_'):
+        rules.append((FLAG, 'Gender_' + col.split('_')[1]))
+    return rules
+
+
+class FeaturePlan:
+    """Mapping from a raw ``user_input`` dict to a model's feature vector.
+
+    The plan is compiled once from ``feature_columns`` and reproduces the
+    column-by-column rules ``predict_with_model`` used to apply to a pandas
+    DataFrame: aliases (Weight_kg -> Weight), complements
+    (Hypertension_No = 1 - Disease_Type_Hypertension) and one-hot flags.
+    Missing values (None/NaN) become 0.
+    """
+
+    def __init__(self, feature_columns):
+        self.feature_columns = list(feature_columns)
+        self.n_features = len(self.feature_columns)
+        self.is_diet = is_diet_columns(self.feature_columns)
+        self.kind = 'diet' if self.is_diet else 'gym'
+
+        make_rules = _diet_rules if self.is_diet else _gym_rules
+        self.rules = tuple(
+            (index, tuple(make_rules(col))) for index, col in enumerate(self.feature_columns)
+        )
+
+    def source_keys(self):
+        """Return every input key the plan reads."""
+        return sorted({key for _, rules in self.rules for _, key in rules})
+
+    def apply(self, input_data, out=None):
+        """Fill and return a float64 row of features for one input dict."""
+        if out is None:
+            out = np.zeros(self.n_features)
+        else:
+            out.fill(0)
+
+        for index, rules in self.rules:
+            for kind, key in rules:
+                if key not in input_data:
+                    continue
+                value = input_data[key]
+                if kind == FLAG:
+                    if value == 1:
+                        out[index] = 1
+                        break
+                    continue
+                if value is None:
+                    break
+                out[index] = 1 - value if kind == COMPLEMENT else value
+                break
+
+        # Missing values are filled with zeros, as the DataFrame path did
+        if math.isnan(out.sum()):
+            out[np.isnan(out)] = 0
+        return out
+
+    def apply_many(self, records):
+        """Return a 2-D float64 feature matrix for a list of dicts or a DataFrame."""
+        if hasattr(records, 'columns'):
+            return self.apply_frame(records)
+
+        matrix = np.zeros((len(records), self.n_features))
+        for row, input_data in zip(matrix, records):
+            self.apply(input_data, out=row)
+        return matrix
+
+    def apply_frame(self, frame):
+        """Vectorized ``apply`` over the rows of a DataFrame of raw inputs.
+
+        Every column of the frame counts as present in every row, exactly as
+        if each row had been passed to ``apply`` as a dict.
+        """
+        n_rows = len(frame)
+        matrix = np.zeros((n_rows, self.n_features))
+        columns = set(frame.columns)
+        values = {}
+
+        for index, rules in self.rules:
+            # Walk the rules backwards so earlier rules override later ones
+            result = None
+            for kind, key in reversed(rules):
+                if key not in columns:
+                    continue
+                if key not in values:
+                    values[key] = np.asarray(frame[key], dtype=np.float64)
+                value = values[key]
+                if kind == FLAG:
+                    fallback = np.zeros(n_rows) if result is None else result
+                    result = np.where(value == 1, 1.0, fallback)
+                elif kind == COMPLEMENT:
+                    result = 1 - value
+                else:
+                    result = value
+            if result is not None:
+                matrix[:, index] = result
+
+        matrix[np.isnan(matrix)] = 0
+        return matrix
+
+
+class SharedPlan:
+    """One encoding pass for several models.
+
+    Columns whose rules are identical across the models' plans (e.g. Age,
+    or the Disease_Type flags) are computed once into a canonical vector;
+    each model's feature row is then a gather from that vector.
+    """
+
+    def __init__(self, plans):
+        self.plans = list(plans)
+        slots = {}
+        for plan in self.plans:
+            for _, rules in plan.rules:
+                slots.setdefault(rules, len(slots))
+        self.canonical = FeaturePlan([])
+        self.canonical.rules = tuple((slot, rules) for rules, slot in slots.items())
+        self.canonical.n_features = len(slots)
+        self.indices = [
+            np.array([slots[rules] for _, rules in plan.rules], dtype=np.intp) for plan in self.plans
+        ]
+
+    def apply(self, input_data):
+        """Return one feature row per plan, from a single pass over the input."""
+        canonical = self.canonical.apply(input_data)
+        return [canonical[index] for index in self.indices]
+
+
+class ProfileSchema:
+    """A model's feature columns declared over the fields of a ``Profile``.
+
+    Derived from the model's ``FeaturePlan``: each column reads the field
+    behind the first input key its rules would find in a full input dict
+    (directly or as a complement), after any one-hot FLAG rules in front of
+    it. Filling a feature row is then a gather from the profile's values,
+    with the same result as ``FeaturePlan.apply`` on ``profile.to_input()``.
+    """
+
+    def __init__(self, feature_columns):
+        plan = get_plan(feature_columns)
+        self.feature_columns = plan.feature_columns
+        self.n_features = plan.n_features
+        self.kind = plan.kind
+        field_of = {key: PROFILE_FIELDS.index(field) for key, field in INPUT_FIELDS}
+
+        index = np.zeros(self.n_features, dtype=np.intp)
+        complement = np.zeros(self.n_features, dtype=bool)
+        unmapped = np.ones(self.n_features, dtype=bool)
+        self.fields = []
+        self.flags = []
+        for column, rules in plan.rules:
+            flag_fields = []
+            source = None
+            for kind, key in rules:
+                if key not in field_of:
+                    continue
+                if kind == FLAG:
+                    flag_fields.append(field_of[key])
+                    continue
+                source = field_of[key]
+                index[column] = source
+                complement[column] = kind == COMPLEMENT
+                unmapped[column] = False
+                break
+            if flag_fields:
+                self.flags.append((column, np.array(flag_fields, dtype=np.intp)))
+            self.fields.append(None if source is None else PROFILE_FIELDS[source])
+
+        self.index = index
+        self.complement = np.flatnonzero(complement)
+        self.unmapped = np.flatnonzero(unmapped)
+
+    def apply_values(self, values):
+        """Map profile values, one row (1-D) or a batch (2-D), to feature rows."""
+        out = values[..., self.index]
+        if len(self.complement):
+            out[..., self.complement] = 1 - out[..., self.complement]
+        if len(self.unmapped):
+            out[..., self.unmapped] = 0
+        for column, flag_fields in self.flags:
+            out[..., column] = np.where((values[..., flag_fields] == 1).any(axis=-1), 1.0, out[..., column])
+        return out
+
+    def apply(self, profile):
+        """Return the float64 feature row for a ``Profile``."""
+        return self.apply_values(profile.to_array())
+
+    def apply_batch(self, batch):
+        """Return the feature matrix for a ``ProfileBatch``."""
+        return self.apply_values(batch.values)
+
+
+# Plans depend only on the column names, so they are keyed on them: a model
+# reloaded with the same columns reuses its plan.
+_plans = {}
+
+
+def get_plan(feature_columns):
+    """Return the cached ``FeaturePlan`` for a model's feature columns."""
+    key = tuple(feature_columns)
+    plan = _plans.get(key)
+    if plan is None:
+        plan = _plans[key] = FeaturePlan(feature_columns)
+    return plan
+
+
+_shared_plans = {}
+
+
+def get_shared_plan(feature_columns_list):
+    """Return the cached ``SharedPlan`` for several models' feature columns."""
+    key = tuple(tuple(columns) for columns in feature_columns_list)
+    shared = _shared_plans.get(key)
+    if shared is None:
+        shared = _shared_plans[key] = SharedPlan([get_plan(columns) for columns in feature_columns_list])
+    return shared
+
+
+_schemas = {}
+
+
+def get_schema(feature_columns):
+    """Return the cached ``ProfileSchema`` for a model's feature columns."""
+    key = tuple(feature_columns)
+    schema = _schemas.get(key)
+    if schema is None:
+        schema = _schemas[key] = ProfileSchema(feature_columns)
+    return schema
@@ -0,0 +1,202 @@
+"""In-process metrics for the prediction hot path.
+
+Instrumentation is off until ``configure_instrumentation`` is called; until
+then ``start_timer`` hands out a shared no-op timer, so instrumented code
+pays for one function call and a few no-op method calls per prediction.
+
+Once on, every prediction records how long each stage took (mapping,
+validation, predict, inverse_transform) in histograms, and counts
+predictions and errors per model. ``render_prometheus`` exports them in
+the Prometheus text format and ``summary`` as plain rows for display.
+
+Log messages go through the standard ``logging`` module; debug output of
+the hot path is only formatted when the DEBUG level is enabled.
+"""
+import bisect
+import logging
+import threading
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    "predictions_total": ("counter", "Rows predicted"),
+    "prediction_errors_total": ("counter", "Failed prediction calls"),
+    "prediction_seconds": ("histogram", "End to end prediction call latency"),
+    "prediction_stage_seconds": ("histogram", "Latency of each prediction stage"),
+}
+
+_metrics = None
+
+
+class Histogram:
+    """Fixed-bucket histogram with a running sum and count."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket that holds it."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """Thread-safe counters and histograms keyed by metric name and labels."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render_prometheus(self):
+        """Return every metric in the Prometheus text exposition format."""
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h.counts), h.sum, h.count)) for key, h in self._histograms.items())
+
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {METRICS.get(name, (kind, name))[1]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name, "counter")
+            lines.append(f"{name}{label_text(labels)} {value}")
+        for (name, labels), (counts, total, count) in histograms:
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{label_text(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{label_text(labels)} {total}")
+            lines.append(f"{name}_count{label_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Return one row per series: counters with their value, histograms with count, mean and quantiles."""
+        with self._lock:
+            rows = [dict(labels, metric=name, value=value) for (name, labels), value in sorted(self._counters.items())]
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                rows.append(dict(
+                    labels,
+                    metric=name,
+                    count=histogram.count,
+                    mean_ms=round(histogram.sum / histogram.count * 1000, 3) if histogram.count else 0.0,
+                    p50_ms_le=histogram.quantile(0.5) * 1000,
+                    p95_ms_le=histogram.quantile(0.95) * 1000,
+                    p99_ms_le=histogram.quantile(0.99) * 1000,
+                ))
+        return rows
+
+
+class StageTimer:
+    """Times consecutive stages of one prediction call."""
+
+    __slots__ = ("metrics", "model", "start", "last")
+
+    def __init__(self, metrics, model):
+        self.metrics = metrics
+        self.model = model
+        self.start = self.last = time.perf_counter()
+
+    def mark(self, stage):
+        """Record the time since the previous mark (or the start) as ``stage``."""
+        now = time.perf_counter()
+        self.metrics.observe("prediction_stage_seconds", now - self.last, stage=stage, model=self.model)
+        self.last = now
+
+    def finish(self, rows=1, error=False):
+        """Record the whole call and count its rows (or the error)."""
+        self.metrics.observe("prediction_seconds", time.perf_counter() - self.start, model=self.model)
+        if error:
+            self.metrics.inc("prediction_errors_total", model=self.model)
+        else:
+            self.metrics.inc("predictions_total", rows, model=self.model)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def mark(self, stage):
+        pass
+
+    def finish(self, rows=1, error=False):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+def start_timer(model):
+    """Return a ``StageTimer`` for ``model``, or a no-op timer when instrumentation is off."""
+    metrics = _metrics
+    if metrics is None:
+        return NULL_TIMER
+    return StageTimer(metrics, model)
+
+
+def configure_instrumentation(enabled=True, log_level=None, buckets=LATENCY_BUCKETS):
+    """Turn metrics collection on (or off with ``enabled=False``); return the active ``Metrics``.
+
+    ``log_level`` (e.g. ``logging.DEBUG``) also sets the level of the
+    prediction loggers, which log through the standard ``logging`` handlers.
+    """
+    global _metrics
+    if log_level is not None:
+        for name in ("utils", "registry"):
+            logging.getLogger(name).setLevel(log_level)
+    _metrics = Metrics(buckets) if enabled else None
+    return _metrics
+
+
+def get_metrics():
+    """Return the active ``Metrics``, or None when instrumentation is off."""
+    return _metrics
@@ -0,0 +1,206 @@
+"""Load test for the form-submit path of app.py.
+
+Streamlit runs every session's script on its own thread in one process, so
+simulated users here are threads in one process calling what a submit
+calls: ``Profile.from_form`` on the form's selections and ``predict_plans``
+on the models from the registry, with the prediction cache and metrics set
+up as in app.py. Selections are drawn from the form's option sets
+(profiles.random_profile).
+
+Closed loop (default): N users submit back to back, with an optional think
+time, for ``--duration`` seconds per concurrency level. Open loop
+(``--rates``): submits arrive as a Poisson process at each rate and are
+served by ``--concurrency`` threads; latency includes the time queued.
+
+    python loadtest.py --concurrency 1 2 4 8 16 32 --duration 10
+    python loadtest.py --rates 50 100 200 400 --concurrency 8 --slo-ms 200
+
+The saturation point is the first level whose throughput reaches 90% of the
+best throughput seen: beyond it more users only add latency. For open loop
+it is the first rate the process cannot keep up with (served less than 95%
+of the offered rate, or p95 over the SLO).
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from instrumentation import configure_instrumentation, get_metrics
+from profiles import Profile, random_profile
+from registry import MODEL_FILES, get_model, load_models
+from utils import configure_prediction_cache, get_prediction_cache, predict_plans
+
+# Share of the best throughput at which the closed loop counts as saturated
+SATURATION_THROUGHPUT = 0.9
+# Share of the offered rate an open-loop run must serve to keep up
+SATURATION_RATE = 0.95
+
+
+def submit(models, selections):
+    """One form submit; return True if every model produced a plan."""
+    profile = Profile.from_form(**selections)
+    plans = predict_plans(models, profile, explain=True)
+    return all(plan["error"] is None for plan in plans.values())
+
+
+def _timed_submit(models, selections, started):
+    try:
+        ok = submit(models, selections)
+    except Exception:
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+def run_closed(models, concurrency, duration, think_time=0.0, seed=0):
+    """Run ``concurrency`` users back to back for ``duration`` seconds; return (samples, elapsed)."""
+    samples = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def user(index):
+        rng = random.Random(f"{seed}-{index}")
+        local = []
+        while time.perf_counter() < deadline:
+            local.append(_timed_submit(models, random_profile(rng), time.perf_counter()))
+            if think_time:
+                time.sleep(rng.expovariate(1 / think_time))
+        with lock:
+            samples.extend(local)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - start
+
+
+def run_open(models, rate, concurrency, duration, seed=0):
+    """Offer submits at ``rate`` per second (Poisson arrivals) for ``duration`` seconds."""
+    rng = random.Random(seed)
+    futures = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency, thread_name_prefix="session") as executor:
+        arrival = start
+        while True:
+            arrival += rng.expovariate(rate)
+            if arrival - start >= duration:
+                break
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            # Latency counts from the scheduled arrival, so queueing shows up
+            futures.append(executor.submit(_timed_submit, models, random_profile(rng), arrival))
+        samples = [future.result() for future in futures]
+    return samples, time.perf_counter() - start
+
+
+def summarize(samples, elapsed, **level):
+    latencies = np.array([latency for latency, _ in samples]) * 1000
+    errors = sum(1 for _, ok in samples if not ok)
+    row = dict(level)
+    row.update({
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+    })
+    for q in (50, 95, 99):
+        row[f"p{q}_ms"] = round(float(np.percentile(latencies, q)), 2) if len(samples) else None
+    row["max_ms"] = round(float(latencies.max()), 2) if len(samples) else None
+    return row
+
+
+def find_saturation(rows, slo_ms=None):
+    """Return the saturated row: the knee of the throughput curve, or the first open-loop rate not kept up with."""
+    if not rows:
+        return None
+    if "rate" in rows[0]:
+        for row in rows:
+            if row["throughput_rps"] < SATURATION_RATE * row["rate"] or (slo_ms and row["p95_ms"] > slo_ms):
+                return row
+        return None
+    best = max(row["throughput_rps"] for row in rows)
+    for row in rows:
+        if row["throughput_rps"] >= SATURATION_THROUGHPUT * best:
+            return row
+    return rows[-1]
+
+
+def print_row(row):
+    level = f"rate {row['rate']:>7}/s" if "rate" in row else f"users {row['concurrency']:>4}"
+    print(f"{level}  {row['requests']:>7} req  {row['throughput_rps']:>8.1f} req/s  "
+          f"p50 {row['p50_ms']:>8.2f}  p95 {row['p95_ms']:>8.2f}  p99 {row['p99_ms']:>8.2f} ms  "
+          f"errors {row['error_rate']:.2%}", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the form-submit path of app.py.")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 2, 4, 8, 16, 32],
+                        help="simulated users per level (closed loop), or serving threads (open loop)")
+    parser.add_argument("--rates", nargs="+", type=float, help="open loop: submits per second to offer")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per level")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean seconds between a user's submits")
+    parser.add_argument("--slo-ms", type=float, help="p95 latency objective used to size the deployment")
+    parser.add_argument("--no-cache", action="store_true", help="disable the prediction cache app.py enables")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    # Same per-process setup as app.py
+    if not args.no_cache and get_prediction_cache() is None:
+        configure_prediction_cache(maxsize=10000, ttl=3600)
+    if get_metrics() is None:
+        configure_instrumentation()
+
+    # Through the registry, as app.py
+    models = load_models(MODEL_FILES, get_model)
+    if not models:
+        print("No models could be loaded", file=sys.stderr)
+        return 1
+    # Warm up outside the measurements (plans, first-call overheads)
+    run_closed(models, 1, 0.5, seed=f"{args.seed}-warmup")
+
+    rows = []
+    if args.rates:
+        for level, rate in enumerate(args.rates):
+            # Fresh profiles per level, so cache hits stay as rare as with real users
+            samples, elapsed = run_open(models, rate, max(args.concurrency), args.duration, f"{args.seed}-{level}")
+            rows.append(summarize(samples, elapsed, rate=rate, concurrency=max(args.concurrency)))
+            print_row(rows[-1])
+    else:
+        for level, concurrency in enumerate(args.concurrency):
+            samples, elapsed = run_closed(models, concurrency, args.duration, args.think_time, f"{args.seed}-{level}")
+            rows.append(summarize(samples, elapsed, concurrency=concurrency))
+            print_row(rows[-1])
+
+    saturation = find_saturation(rows, args.slo_ms)
+    if saturation is None:
+        print("No saturation within the tested levels")
+    elif "rate" in saturation:
+        print(f"Saturated at {saturation['rate']}/s offered: served {saturation['throughput_rps']}/s, "
+              f"p95 {saturation['p95_ms']} ms")
+    else:
+        print(f"Saturation at {saturation['concurrency']} concurrent users: {saturation['throughput_rps']} req/s, "
+              f"p95 {saturation['p95_ms']} ms")
+    if args.slo_ms and "rate" not in rows[0]:
+        within = [row for row in rows if row["p95_ms"] <= args.slo_ms and row["error_rate"] == 0]
+        if within:
+            print(f"Largest level within p95 <= {args.slo_ms:g} ms: {within[-1]['concurrency']} users")
+        else:
+            print(f"No level meets p95 <= {args.slo_ms:g} ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"results": rows, "saturation": saturation, "slo_ms": args.slo_ms}, f, indent=2)
+        print(f"Wrote {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,416 @@
+"""Precomputed lookup table over the categorical part of the input space.
+
+Apart from age, weight and height (and BMI derived from them) every form
+input is a discrete choice. ``build_table`` enumerates every categorical
+combination the form can produce and, for each one, every cell of a coarse
+age x weight x height grid. A (combination, cell) entry stores a label only
+if that label provably wins anywhere in the cell: for each tree the leaves
+reachable from the cell are collected, and the worst case over those leaves
+must still leave the label ahead of every other class. Everything else is
+marked inexact and answered by the model.
+
+    python lookup_table.py build diet_model.pkl
+    python lookup_table.py check diet_model.pkl
+"""
+import argparse
+import bisect
+import itertools
+import json
+import os
+import sys
+
+import numpy as np
+
+from feature_plan import get_plan
+from forest_engine import compile_model
+from profiles import (ACTIVITY_LEVELS, AGE_RANGE, ALLERGIES, CUISINES, DIETARY_RESTRICTIONS, DISEASE_TYPES,
+                      FITNESS_GOALS, GENDERS, HEIGHT_RANGE, SEVERITIES, WEIGHT_RANGE, encode_profile)
+
+TABLE_VERSION = 1
+
+# Codes stored for entries without an exact answer
+INEXACT = 254
+# Summed class margins must exceed this to count as a strict win; it covers
+# floating point differences between the bound and the forest's own sums.
+MARGIN = 1e-9
+
+# Input keys that feed the numeric axes of the grid
+NUMERIC_AXES = {
+    "Age": "age", "Weight_kg": "weight", "Weight": "weight",
+    "Height_cm": "height", "Height": "height", "BMI": "bmi",
+}
+
+DEFAULT_BANDS = {"age": 6, "weight": 10, "height": 6}
+
+
+def _subsets(options):
+    # Every distinct multiselect outcome: nothing, or a non-empty set of real options
+    choices = options[1:]
+    return [["None"]] + [list(c) for r in range(1, len(choices) + 1) for c in itertools.combinations(choices, r)]
+
+
+def form_combinations():
+    """Yield encode_profile keyword arguments for every categorical combination of the form."""
+    for gender, goal, diseases, severity, activity, restrictions, allergies, cuisines in itertools.product(
+            GENDERS, FITNESS_GOALS, _subsets(DISEASE_TYPES), SEVERITIES, ACTIVITY_LEVELS,
+            _subsets(DIETARY_RESTRICTIONS), _subsets(ALLERGIES), _subsets(CUISINES)):
+        yield {
+            "gender": gender, "fitness_goal": goal, "disease_type": diseases, "severity": severity,
+            "activity_level": activity, "dietary_restrictions": restrictions, "allergies": allergies,
+            "preferred_cuisine": cuisines,
+        }
+
+
+def numeric_columns(plan):
+    """Map the grid axes to the feature columns that read them."""
+    axes = {}
+    for index, rules in plan.rules:
+        for _, key in rules:
+            if key in NUMERIC_AXES:
+                axes.setdefault(NUMERIC_AXES[key], index)
+                break
+    return axes
+
+
+def _band_edges(value_range, bands):
+    return np.linspace(value_range[0], value_range[1], bands + 1)
+
+
+class LookupTable:
+    """Categorical-combination x numeric-cell table of exact labels."""
+
+    def __init__(self, feature_columns, labels, keys, codes, edges, model_sha256=None):
+        self.feature_columns = list(feature_columns)
+        self.labels = np.asarray(labels).astype(str)
+        self.keys = keys
+        self.codes = codes
+        self.edges = edges
+        self.model_sha256 = model_sha256
+
+        plan = get_plan(self.feature_columns)
+        self.axes = numeric_columns(plan)
+        numeric = set(self.axes.values())
+        self.categorical = np.array([i for i in range(len(self.feature_columns)) if i not in numeric], dtype=np.intp)
+        self.key_weights = 2.0 ** np.arange(len(self.categorical))
+
+        # BMI range of each cell, from its weight and height bands
+        self.grid_axes = [axis for axis in ("age", "weight", "height") if axis in self.axes]
+        self.shape = tuple(len(self.edges[axis]) - 1 for axis in self.grid_axes)
+        self.bmi_bounds = _cell_bmi_bounds(self.edges, self.grid_axes, self.shape)
+
+        self._positions = {key: position for position, key in enumerate(self.keys.tolist())}
+        self._grid = [(axis, size, self.edges[axis].tolist()) for axis, size in zip(self.grid_axes, self.shape)]
+
+    @property
+    def exact_fraction(self):
+        """Fraction of table entries that hold an exact label."""
+        return float((self.codes != INEXACT).mean()) if self.codes.size else 0.0
+
+    def lookup_rows(self, features):
+        """Return label codes for feature rows, or -1 where the table has no exact answer."""
+        features = np.atleast_2d(np.asarray(features, dtype=np.float64))
+        result = np.full(len(features), -1, dtype=np.intp)
+
+        categorical = features[:, self.categorical]
+        valid = ((categorical == 0) | (categorical == 1)).all(axis=1)
+        keys = categorical @ self.key_weights
+        positions = np.searchsorted(self.keys, keys)
+        positions[positions >= len(self.keys)] = 0
+        valid &= self.keys[positions] == keys
+
+        cell = np.zeros(len(features), dtype=np.intp)
+        for axis, size in zip(self.grid_axes, self.shape):
+            edges = self.edges[axis]
+            values = features[:, self.axes[axis]]
+            valid &= (values >= edges[0]) & (values <= edges[-1])
+            band = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, size - 1)
+            cell = cell * size + band
+
+        if "bmi" in self.axes:
+            bmi = features[:, self.axes["bmi"]]
+            valid &= (bmi >= self.bmi_bounds[cell, 0]) & (bmi <= self.bmi_bounds[cell, 1])
+
+        codes = self.codes[positions, cell]
+        valid &= codes != INEXACT
+        result[valid] = codes[valid]
+        return result
+
+    def lookup(self, input_data):
+        """Return the exact label for an input dict, or None if the model must decide."""
+        row = get_plan(self.feature_columns).apply(input_data)
+
+        # Scalar version of lookup_rows; single requests are dominated by
+        # per-call NumPy overhead otherwise
+        categorical = row[self.categorical]
+        key = float(categorical @ self.key_weights)
+        position = self._positions.get(key)
+        if position is None or not ((categorical == 0) | (categorical == 1)).all():
+            return None
+
+        cell = 0
+        for axis, size, edges in self._grid:
+            value = row[self.axes[axis]]
+            if not edges[0] <= value <= edges[-1]:
+                return None
+            cell = cell * size + min(bisect.bisect_right(edges, value) - 1, size - 1)
+
+        if "bmi" in self.axes:
+            bmi = row[self.axes["bmi"]]
+            if not self.bmi_bounds[cell, 0] <= bmi <= self.bmi_bounds[cell, 1]:
+                return None
+
+        code = self.codes[position, cell]
+        return None if code == INEXACT else self.labels[code]
+
+    def predict(self, model, input_data):
+        """Return ``(label, exact)``, falling back to ``model`` when the table cannot answer."""
+        from utils import predict_with_model
+
+        label = self.lookup(input_data)
+        if label is not None:
+            return label, True
+        return predict_with_model(model, input_data), False
+
+    def save(self, path):
+        meta = {
+            "version": TABLE_VERSION,
+            "feature_columns": self.feature_columns,
+            "model_sha256": self.model_sha256,
+            "grid_axes": self.grid_axes,
+        }
+        arrays = {f"edges_{axis}": self.edges[axis] for axis in self.grid_axes}
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, meta=np.array(json.dumps(meta)), labels=self.labels,
+                                keys=self.keys, codes=self.codes, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta["version"] != TABLE_VERSION:
+                raise ValueError(f"Unsupported lookup table version {meta['version']} in {path}")
+            edges = {axis: data[f"edges_{axis}"] for axis in meta["grid_axes"]}
+            return cls(meta["feature_columns"], data["labels"], data["keys"], data["codes"], edges,
+                       meta.get("model_sha256"))
+
+
+def _cell_bmi_bounds(edges, grid_axes, shape):
+    # BMI is derived from weight and height, so each cell only admits a range
+    n_cells = int(np.prod(shape)) if shape else 1
+    bounds = np.empty((n_cells, 2))
+    bounds[:, 0], bounds[:, 1] = -np.inf, np.inf
+    if "weight" in grid_axes and "height" in grid_axes:
+        grids = np.meshgrid(*[np.arange(size) for size in shape], indexing='ij')
+        bands = {axis: grid.ravel() for axis, grid in zip(grid_axes, grids)}
+        w_lo, w_hi = edges["weight"][bands["weight"]], edges["weight"][bands["weight"] + 1]
+        h_lo, h_hi = edges["height"][bands["height"]] / 100, edges["height"][bands["height"] + 1] / 100
+        # calculate_bmi rounds to 2 decimals
+        bounds[:, 0] = w_lo / (h_hi * h_hi) - 0.005
+        bounds[:, 1] = w_hi / (h_lo * h_lo) + 0.005
+    return bounds
+
+
+def _cell_boxes(table_shape, edges, grid_axes, axes, n_features, bmi_bounds):
+    # Per-cell float32 [lo, hi] bounds for every feature (categorical ones unbounded)
+    n_cells = len(bmi_bounds)
+    lo = np.full((n_cells, n_features), -np.inf, dtype=np.float32)
+    hi = np.full((n_cells, n_features), np.inf, dtype=np.float32)
+    grids = np.meshgrid(*[np.arange(size) for size in table_shape], indexing='ij')
+    for axis, grid in zip(grid_axes, grids):
+        band = grid.ravel()
+        lo[:, axes[axis]] = edges[axis][band]
+        hi[:, axes[axis]] = edges[axis][band + 1]
+    if "bmi" in axes:
+        lo[:, axes["bmi"]] = bmi_bounds[:, 0]
+        hi[:, axes["bmi"]] = bmi_bounds[:, 1]
+    # Compare in float64 against the thresholds, as the forest does
+    return lo.astype(np.float64), hi.astype(np.float64)
+
+
+def _reachable_leaves(forest, root, end, numeric, categorical_rows, cell_lo, cell_hi):
+    """Leaf reachability of one tree for categorical rows and for numeric cells."""
+    n_nodes = end - root
+    rows_reach = np.zeros((n_nodes, len(categorical_rows)), dtype=bool)
+    cells_reach = np.zeros((n_nodes, len(cell_lo)), dtype=bool)
+    rows_reach[0] = True
+    cells_reach[0] = True
+    # Nodes are stored parents-first, so one forward pass propagates reachability
+    for local in range(n_nodes):
+        node = root + local
+        left, right = forest.children[node] - root
+        if left == local:
+            continue
+        feature = forest.feature[node]
+        threshold = forest.threshold[node]
+        if numeric[feature]:
+            rows_reach[left] = rows_reach[right] = rows_reach[local]
+            cells_reach[left] = cells_reach[local] & (cell_lo[:, feature] <= threshold)
+            cells_reach[right] = cells_reach[local] & (cell_hi[:, feature] > threshold)
+        else:
+            go_left = categorical_rows[:, feature] <= threshold
+            rows_reach[left] = rows_reach[local] & go_left
+            rows_reach[right] = rows_reach[local] & ~go_left
+            cells_reach[left] = cells_reach[right] = cells_reach[local]
+
+    leaves = np.flatnonzero(forest.children[root:end, 0] == np.arange(root, end))
+    return leaves + root, rows_reach[leaves].T, cells_reach[leaves].T
+
+
+def _pattern_ids(reach):
+    # Group identical boolean rows; packing them into 64-bit words first makes
+    # np.unique far cheaper than on the raw boolean matrix
+    packed = np.packbits(reach, axis=1)
+    padding = -packed.shape[1] % 8
+    words = np.ascontiguousarray(np.pad(packed, ((0, 0), (0, padding)))).view(np.uint64)
+    _, first, inverse = np.unique(words, axis=0, return_index=True, return_inverse=True)
+    return reach[first], inverse.ravel()
+
+
+def _worst_margins(values, row_patterns, cell_patterns, pairs):
+    # For every row pattern x cell pattern and class pair (c, d): the smallest
+    # p_c - p_d over the leaves reachable from both. Each leaf is reachable
+    # from few patterns, so update only the block of patterns that reach it.
+    first, second = np.array(pairs).T
+    diffs = values[:, first] - values[:, second]
+    margins = np.full((len(row_patterns), len(cell_patterns), len(pairs)), np.inf)
+    for leaf, diff in enumerate(diffs):
+        rows = np.flatnonzero(row_patterns[:, leaf])
+        cells = np.flatnonzero(cell_patterns[:, leaf])
+        if rows.size and cells.size:
+            block = np.ix_(rows, cells)
+            margins[block] = np.minimum(margins[block], diff)
+    return margins
+
+
+def _check_layout(forest):
+    """Raise ValueError unless each tree is its own block of parents-first nodes, as compile_forest lays them out."""
+    nodes = np.arange(forest.n_nodes)
+    ends = np.append(forest.roots[1:], forest.n_nodes)
+    in_order = forest.roots[0] == 0 and (ends > forest.roots).all()
+    # End of the block of the tree each node belongs to
+    node_ends = ends[np.searchsorted(forest.roots, nodes, side='right') - 1]
+    internal = forest.left != nodes
+    for side in (forest.left, forest.right):
+        children = side[internal]
+        in_order = in_order and ((children > nodes[internal]) & (children < node_ends[internal])).all()
+    if len(forest.value) != forest.n_nodes or not in_order:
+        raise ValueError("Lookup tables need the full forest, with one parents-first block of nodes per tree "
+                         "(a compact model?); build the table from the pickled model")
+
+
+def build_table(model, bands=None, chunk_size=4096, model_sha256=None, progress=None):
+    """Enumerate the categorical space of ``model`` and return a ``LookupTable``."""
+    bands = dict(DEFAULT_BANDS, **(bands or {}))
+    forest, label_encoder, feature_columns = compile_model(model)
+    _check_layout(forest)
+    plan = get_plan(feature_columns)
+    axes = numeric_columns(plan)
+    numeric = np.zeros(forest.n_features, dtype=bool)
+    numeric[list(axes.values())] = True
+
+    # Distinct categorical feature rows the form can produce for this model
+    rows = set()
+    for combination in form_combinations():
+        row = plan.apply(encode_profile(AGE_RANGE[0], WEIGHT_RANGE[0], HEIGHT_RANGE[0], **combination))
+        row[numeric] = 0
+        rows.add(row.tobytes())
+    categorical_rows = np.array([np.frombuffer(row) for row in rows])
+
+    ranges = {"age": AGE_RANGE, "weight": WEIGHT_RANGE, "height": HEIGHT_RANGE}
+    edges = {axis: _band_edges(ranges[axis], bands[axis]) for axis in ("age", "weight", "height") if axis in axes}
+    table = LookupTable(feature_columns, label_encoder.classes_, np.zeros(0), np.zeros((0, 0), np.uint8),
+                        edges, model_sha256)
+
+    # Keys in the same order lookup_rows computes them, sorted for searchsorted
+    keys = categorical_rows[:, table.categorical] @ table.key_weights
+    order = np.argsort(keys)
+    keys, categorical_rows = keys[order], categorical_rows[order]
+
+    cell_lo, cell_hi = _cell_boxes(table.shape, edges, table.grid_axes, axes, forest.n_features, table.bmi_bounds)
+    n_classes = forest.n_classes
+    pairs = [(c, d) for c in range(n_classes) for d in range(n_classes) if c != d]
+    ends = list(forest.roots[1:]) + [forest.n_nodes]
+
+    codes = np.full((len(keys), len(cell_lo)), INEXACT, dtype=np.uint8)
+    for start in range(0, len(keys), chunk_size):
+        chunk = categorical_rows[start:start + chunk_size]
+        totals = np.zeros((len(chunk), len(cell_lo), len(pairs)))
+        for root, end in zip(forest.roots, ends):
+            leaves, rows_reach, cells_reach = _reachable_leaves(forest, root, end, numeric, chunk, cell_lo, cell_hi)
+            row_patterns, row_index = _pattern_ids(rows_reach)
+            cell_patterns, cell_index = _pattern_ids(cells_reach)
+            margins = _worst_margins(forest.value[leaves], row_patterns, cell_patterns, pairs)
+            totals += margins[row_index[:, None], cell_index[None, :]]
+
+        for c in range(n_classes):
+            wins = np.ones(totals.shape[:2], dtype=bool)
+            for j, (first, _) in enumerate(pairs):
+                if first == c:
+                    wins &= totals[:, :, j] > MARGIN
+            codes[start:start + chunk_size][wins] = c
+        if progress is not None:
+            progress(min(start + chunk_size, len(keys)), len(keys))
+
+    # The forest predicts classes_[argmax]; store label codes for label_encoder
+    class_codes = np.append(forest.classes_.astype(np.intp), [INEXACT])
+    codes = class_codes[np.where(codes == INEXACT, n_classes, codes)].astype(np.uint8)
+    return LookupTable(feature_columns, label_encoder.classes_, keys, codes, edges, model_sha256)
+
+
+def table_path(model_filename):
+    from utils import MODEL_DIR
+
+    return os.path.join(MODEL_DIR, os.path.splitext(model_filename)[0] + ".lookup.npz")
+
+
+def check_table(table, model, n_profiles=20000, seed=0):
+    """Return (coverage, mismatches) of the table on random form profiles."""
+    import random
+
+    from profiles import random_profile
+    from utils import predict_batch
+
+    rng = random.Random(seed)
+    inputs = [encode_profile(**random_profile(rng)) for _ in range(n_profiles)]
+    features = get_plan(table.feature_columns).apply_many(inputs)
+    codes = table.lookup_rows(features)
+    exact = codes >= 0
+    expected = np.asarray(predict_batch(model, inputs))
+    mismatches = int((table.labels[codes[exact]] != expected[exact]).sum())
+    return float(exact.mean()), mismatches
+
+
+def main(argv=None):
+    from registry import file_sha256
+    from utils import MODEL_DIR, load_model
+
+    parser = argparse.ArgumentParser(description="Build or check categorical lookup tables.")
+    parser.add_argument("command", choices=["build", "check"])
+    parser.add_argument("model", help="model file in the model directory")
+    parser.add_argument("-o", "--output", help="table file (default: model/<name>.lookup.npz)")
+    for axis, default in DEFAULT_BANDS.items():
+        parser.add_argument(f"--{axis}-bands", type=int, default=default, help=f"grid bands for {axis}")
+    args = parser.parse_args(argv)
+
+    path = args.output or table_path(args.model)
+    model = load_model(args.model)
+
+    if args.command == "build":
+        bands = {axis: getattr(args, f"{axis}_bands") for axis in DEFAULT_BANDS}
+        sha256 = file_sha256(os.path.join(MODEL_DIR, args.model))
+        report = lambda done, total: print(f"{done}/{total} combinations", file=sys.stderr)
+        table = build_table(model, bands, model_sha256=sha256, progress=report)
+        table.save(path)
+        print(f"Wrote {path}: {len(table.keys)} combinations x {table.codes.shape[1]} cells, "
+              f"{table.exact_fraction:.1%} of entries exact, {os.path.getsize(path) / 1024:.0f} KiB")
+
+    table = LookupTable.load(path)
+    if table.model_sha256 and table.model_sha256 != file_sha256(os.path.join(MODEL_DIR, args.model)):
+        print(f"Warning: {path} was built for a different version of {args.model}", file=sys.stderr)
+    coverage, mismatches = check_table(table, model)
+    print(f"{path}: answers {coverage:.1%} of random profiles exactly, {mismatches} mismatches")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+"""Compact forest variant for memory-constrained workers.
+
+``compact_forest`` rewrites a compiled forest (see forest_engine.py) into a
+smaller one that predicts the same way:
+
+- thresholds are stored as float32, rounded down to the largest float32 not
+  above the float64 split value. Inputs are float32 (as in sklearn), and
+  for a float32 ``x``, ``x > t`` holds exactly when ``x > floor32(t)``.
+- node ids are int32 and feature ids the narrowest unsigned type that fits.
+- identical subtrees, within a tree and across trees, are stored once;
+  leaves with the same class distribution are one leaf.
+- splits whose two sides are the same subtree are removed, as they cannot
+  change the result. With ``tolerance`` > 0, subtrees whose leaves all
+  predict the same class and whose distributions differ by at most
+  ``tolerance`` are also replaced by a leaf with the node's own
+  distribution; this is lossy, so check the agreement it reports.
+- only leaves keep a class distribution, stored as float32 when that is
+  exact. Leaves come first, so a leaf's node id is its row in ``value``.
+
+The compact forest is written in the memory-mapped format of
+model_format.py, which ``load_model`` (and so the model registry) loads
+like any other model file:
+
+    python model_compact.py diet_model.pkl        # writes model/diet_model.compact.fmap
+    python model_compact.py diet_model.pkl --tolerance 0.05 --validation profiles.csv
+
+The report lists the node count and node array size before and after, and
+how often the compact model agrees with the original on a validation set
+(``--validation``, or random form profiles plus rows on every split
+threshold).
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from forest_engine import CompiledForest, compile_model
+
+# Rows of a validation file encoded per batch
+VALIDATION_CHUNK = 10000
+
+
+def compact_path(filename):
+    """Default compact artifact name, e.g. diet_model.pkl -> diet_model.compact.fmap."""
+    return os.path.splitext(filename)[0] + ".compact.fmap"
+
+
+def _float32_floor(values):
+    """Largest float32 not above each float64 value."""
+    rounded = values.astype(np.float32)
+    above = rounded.astype(np.float64) > values
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+def _postorder(forest):
+    """Node ids reachable from the roots, children before their parents."""
+    order = []
+    visited = np.zeros(forest.n_nodes, dtype=bool)
+    for root in forest.roots:
+        stack = [(int(root), False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                order.append(node)
+                continue
+            if visited[node]:
+                continue
+            visited[node] = True
+            stack.append((node, True))
+            for child in (int(forest.left[node]), int(forest.right[node])):
+                if child != node and not visited[child]:
+                    stack.append((child, False))
+    return order
+
+
+def compact_forest(forest, tolerance=0.0):
+    """Return a compact ``CompiledForest`` equivalent to ``forest`` (see the module docstring)."""
+    thresholds = _float32_floor(np.asarray(forest.threshold, dtype=np.float64))
+    has_node_values = len(forest.value) == forest.n_nodes
+
+    leaves = {}       # distribution bytes -> new leaf id
+    splits = {}       # (feature, threshold, left, right) -> new split id
+    leaf_values = []
+    split_nodes = []
+    canonical = {}    # old node id -> ("leaf" | "split", new id)
+    # Per canonical node: class-wise min and max over its leaves, its leaves'
+    # common argmax (-1 if they differ), and its depth
+    bounds = {}
+
+    def add_leaf(distribution):
+        key = distribution.tobytes()
+        if key not in leaves:
+            leaves[key] = len(leaf_values)
+            leaf_values.append(distribution)
+            argmax = int(np.argmax(distribution))
+            bounds[("leaf", leaves[key])] = (distribution, distribution, argmax, 0)
+        return ("leaf", leaves[key])
+
+    for node in _postorder(forest):
+        left, right = int(forest.left[node]), int(forest.right[node])
+        if left == node:
+            canonical[node] = add_leaf(np.asarray(forest.value[node], dtype=np.float64))
+            continue
+
+        left_id, right_id = canonical[left], canonical[right]
+        if left_id == right_id:
+            # Both sides lead to the same subtree: the split decides nothing
+            canonical[node] = left_id
+            continue
+
+        left_lo, left_hi, left_argmax, left_depth = bounds[left_id]
+        right_lo, right_hi, right_argmax, right_depth = bounds[right_id]
+        lo, hi = np.minimum(left_lo, right_lo), np.maximum(left_hi, right_hi)
+        argmax = left_argmax if left_argmax == right_argmax else -1
+        if tolerance > 0 and has_node_values and argmax >= 0 and (hi - lo).max() <= tolerance:
+            # The node's own distribution is a weighted mean of its leaves',
+            # so it is within the same bounds and keeps their argmax
+            canonical[node] = add_leaf(np.asarray(forest.value[node], dtype=np.float64))
+            continue
+
+        key = (int(forest.feature[node]), thresholds[node].tobytes(), left_id, right_id)
+        if key not in splits:
+            splits[key] = len(split_nodes)
+            split_nodes.append(key)
+            bounds[("split", splits[key])] = (lo, hi, argmax, 1 + max(left_depth, right_depth))
+        canonical[node] = ("split", splits[key])
+
+    # Leaves first, so leaf node ids index ``value`` directly
+    n_leaves = len(leaf_values)
+    n_nodes = n_leaves + len(split_nodes)
+
+    def new_id(ref):
+        kind, index = ref
+        return index if kind == "leaf" else n_leaves + index
+
+    feature_dtype = np.min_scalar_type(max(forest.n_features - 1, 0))
+    feature = np.zeros(n_nodes, dtype=feature_dtype)
+    threshold = np.zeros(n_nodes, dtype=np.float32)
+    # int32 rather than anything narrower: the traversal computes 2 * node + 1
+    children = np.repeat(np.arange(n_nodes, dtype=np.int32)[:, None], 2, axis=1)
+    for index, (feature_id, threshold_bytes, left_id, right_id) in enumerate(split_nodes):
+        node = n_leaves + index
+        feature[node] = feature_id
+        threshold[node] = np.frombuffer(threshold_bytes, dtype=np.float32)[0]
+        children[node] = (new_id(left_id), new_id(right_id))
+
+    value = np.array(leaf_values, dtype=np.float64)
+    if np.array_equal(value.astype(np.float32).astype(np.float64), value):
+        value = value.astype(np.float32)
+
+    roots = np.array([new_id(canonical[int(root)]) for root in forest.roots], dtype=np.int32)
+    return CompiledForest(
+        feature=feature,
+        threshold=threshold,
+        children=children,
+        value=value,
+        roots=roots,
+        classes=np.asarray(forest.classes_),
+        max_depth=max(bounds[canonical[int(root)]][3] for root in forest.roots),
+        n_features=forest.n_features,
+    )
+
+
+def compact_model(model, tolerance=0.0):
+    """Compact a ``(model, label_encoder, feature_columns)`` tuple; see ``compact_forest``."""
+    forest, labels, feature_columns = compile_model(model)
+    return compact_forest(forest, tolerance), labels, feature_columns
+
+
+def forest_nbytes(forest):
+    """Bytes held by a compiled forest's node arrays."""
+    return sum(getattr(forest, name).nbytes for name in ("feature", "threshold", "children", "value", "roots"))
+
+
+def agreement(model, compact, X):
+    """Return ``(label agreement rate, max absolute probability difference)`` on feature rows ``X``."""
+    original = compile_model(model)[0]
+    expected_proba = original.predict_proba(X)
+    actual_proba = compact[0].predict_proba(X)
+    expected = np.argmax(expected_proba, axis=1)
+    actual = np.argmax(actual_proba, axis=1)
+    return float((expected == actual).mean()), float(np.abs(expected_proba - actual_proba).max())
+
+
+def validation_rows(model, path):
+    """Feature rows of ``model`` for the raw profiles in a CSV or JSONL file."""
+    from feature_plan import get_schema
+    from profiles import ProfileBatch, profile_from_record
+    from score import chunked, read_records
+
+    schema = get_schema(model[2])
+    blocks = []
+    for chunk in chunked(read_records(path), VALIDATION_CHUNK):
+        profiles = []
+        for record in chunk:
+            try:
+                profiles.append(profile_from_record(record))
+            except Exception:
+                continue
+        if profiles:
+            blocks.append(schema.apply_batch(ProfileBatch.from_profiles(profiles)))
+    if not blocks:
+        raise ValueError(f"No valid profiles in {path}")
+    return np.vstack(blocks)
+
+
+def main(argv=None):
+    from forest_engine import parity_inputs
+    from model_format import export_model, load_mapped
+    from registry import file_sha256
+    from utils import MODEL_DIR, load_model
+
+    parser = argparse.ArgumentParser(description="Write a compact variant of a forest model.")
+    parser.add_argument("model", help="model file in the model directory")
+    parser.add_argument("-o", "--output", help="artifact file (default: model/<name>.compact.fmap)")
+    parser.add_argument("--tolerance", type=float, default=0.0,
+                        help="collapse subtrees whose leaf distributions differ by at most this (lossy)")
+    parser.add_argument("--validation", help="CSV or JSONL file of profiles to measure agreement on")
+    parser.add_argument("--min-agreement", type=float, default=1.0,
+                        help="fail (and write nothing) below this label agreement rate")
+    args = parser.parse_args(argv)
+
+    model = load_model(args.model)
+    original = compile_model(model)[0]
+    compact = compact_model(model, args.tolerance)
+    X = validation_rows(model, args.validation) if args.validation else parity_inputs(model)
+    rate, max_diff = agreement(model, compact, X)
+
+    before, after = forest_nbytes(original), forest_nbytes(compact[0])
+    print(f"Nodes: {original.n_nodes} -> {compact[0].n_nodes}, max depth {original.max_depth} -> {compact[0].max_depth}")
+    print(f"Node arrays: {before / 1024:.0f} KiB -> {after / 1024:.0f} KiB ({1 - after / before:.1%} smaller)")
+    print(f"Agreement on {len(X)} rows: {rate:.4%} of labels, max probability difference {max_diff:.3g}")
+    if rate < args.min_agreement:
+        print(f"Agreement below {args.min_agreement:.4%}; nothing written")
+        return 1
+
+    path = args.output or os.path.join(MODEL_DIR, compact_path(args.model))
+    source = os.path.join(MODEL_DIR, args.model)
+    size = export_model(compact, path, source_sha256=file_sha256(source))
+    print(f"Wrote {path}: {size / 1024:.0f} KiB (model file {os.path.getsize(source) / 1024:.0f} KiB)")
+
+    # The written artifact must predict exactly like the compact forest it came from
+    mapped = load_mapped(path)
+    if not np.array_equal(mapped[0].predict_proba(X), compact[0].predict_proba(X)):
+        print(f"{path}: MISMATCH after reloading")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""Memory-mapped model artifacts.
+
+``export_model`` writes a ``(model, label_encoder, feature_columns)`` tuple
+as a compiled forest (see forest_engine.py) in a flat, versioned layout:
+
+    8 bytes   magic b"FORESTMM"
+    4 bytes   format version (little-endian uint32)
+    4 bytes   length of the JSON header (little-endian uint32)
+    header    JSON: labels, feature columns and the dtype/shape/offset of each array
+    arrays    raw little-endian node arrays, each aligned to ALIGNMENT bytes
+
+``load_mapped`` maps the file read-only and builds the forest on views of
+the mapping, so nothing is deserialized: loading costs the same for any
+model size and every process mapping the file shares its pages through
+the OS page cache. ``load_model`` recognizes the format by its magic, and
+the model registry loads ``diet_model.fmap`` in place of ``diet_model.pkl``
+when the artifact was exported from that exact pickle (its SHA-256 is
+recorded as ``source_sha256``).
+
+    python model_format.py export diet_model.pkl   # writes model/diet_model.fmap
+    python model_format.py check diet_model.pkl
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+from forest_engine import CompiledForest, CompiledLabels, compile_model
+
+MAGIC = b"FORESTMM"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+_PREAMBLE = struct.Struct("<8sII")
+
+# CompiledForest arrays stored in the file, with their on-disk dtypes;
+# narrower arrays (of a compact forest, see model_compact.py) keep their own
+ARRAYS = {
+    "feature": "<i8",
+    "threshold": "<f8",
+    "children": "<i8",
+    "value": "<f8",
+    "roots": "<i8",
+}
+
+
+def mapped_path(filename):
+    """Default artifact name for a model file, e.g. diet_model.pkl -> diet_model.fmap."""
+    return os.path.splitext(filename)[0] + ".fmap"
+
+
+def is_mapped_file(path):
+    """Return True if ``path`` starts with the mapped artifact magic."""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def export_model(model, path, source_sha256=None):
+    """Write ``model`` to ``path`` in the mapped format; return the number of bytes written.
+
+    ``source_sha256`` identifies the pickled artifact the model came from.
+
+    The file is written next to ``path`` and renamed over it, so a model
+    registry watching ``path`` never sees a partial artifact.
+    """
+    forest, labels, feature_columns = compile_model(model)
+    arrays = {}
+    for name, dtype in ARRAYS.items():
+        array = getattr(forest, name)
+        dtype = np.dtype(dtype)
+        if array.dtype.itemsize < dtype.itemsize:
+            dtype = array.dtype.newbyteorder("<")
+        arrays[name] = np.ascontiguousarray(array, dtype=dtype)
+    arrays["classes"] = np.ascontiguousarray(forest.classes_)
+    if arrays["classes"].dtype.kind not in "iuf":
+        raise TypeError(f"Cannot export forest classes of dtype {arrays['classes'].dtype}")
+
+    # Offsets are relative to the data section, which starts at the first
+    # aligned position after the header.
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _align(offset + array.nbytes)
+    header_bytes = json.dumps({
+        "n_features": forest.n_features,
+        "max_depth": forest.max_depth,
+        "labels": labels.classes_.tolist(),
+        "labels_dtype": labels.classes_.dtype.str,
+        "feature_columns": [str(column) for column in feature_columns],
+        "source_sha256": source_sha256,
+        "arrays": layout,
+    }).encode()
+    data_start = _align(_PREAMBLE.size + len(header_bytes))
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            for name, array in arrays.items():
+                f.write(b"\0" * (data_start + layout[name]["offset"] - f.tell()))
+                f.write(array.tobytes())
+            f.write(b"\0" * (data_start + offset - f.tell()))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return data_start + offset
+
+
+def _parse_header(path, data):
+    magic, version, header_size = _PREAMBLE.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a mapped model artifact")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+    return json.loads(bytes(data[_PREAMBLE.size:_PREAMBLE.size + header_size])), header_size
+
+
+def read_header(path):
+    """Return the JSON header of a mapped artifact without mapping its arrays."""
+    with open(path, 'rb') as f:
+        preamble = f.read(_PREAMBLE.size)
+        if len(preamble) < _PREAMBLE.size:
+            raise ValueError(f"{path} is not a mapped model artifact")
+        header_size = _PREAMBLE.unpack(preamble)[2]
+        return _parse_header(path, preamble + f.read(header_size))[0]
+
+
+def load_mapped(path):
+    """Map a file written by ``export_model``; return ``(forest, labels, feature_columns)``."""
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    header, header_size = _parse_header(path, buffer)
+    data_start = _align(_PREAMBLE.size + header_size)
+
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        offset = data_start + spec["offset"]
+        if offset + count * dtype.itemsize > len(buffer):
+            raise ValueError(f"{path} is truncated")
+        # Read-only views of the mapping; the arrays keep it open
+        arrays[name] = np.frombuffer(buffer, dtype, count, offset).reshape(spec["shape"])
+
+    forest = CompiledForest(
+        feature=arrays["feature"],
+        threshold=arrays["threshold"],
+        children=arrays["children"],
+        value=arrays["value"],
+        roots=arrays["roots"],
+        classes=arrays["classes"],
+        max_depth=header["max_depth"],
+        n_features=header["n_features"],
+    )
+    labels = CompiledLabels(np.asarray(header["labels"], dtype=np.dtype(header["labels_dtype"])))
+    return forest, labels, header["feature_columns"]
+
+
+def is_mapped_array(array):
+    """Return True if ``array`` is a view of a memory-mapped file."""
+    while isinstance(array, np.ndarray):
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    if isinstance(array, memoryview):
+        array = array.obj
+    return isinstance(array, mmap.mmap)
+
+
+def main(argv=None):
+    from forest_engine import parity_inputs
+    from registry import file_sha256
+    from utils import MODEL_DIR, load_model
+
+    parser = argparse.ArgumentParser(description="Export models to the memory-mapped format.")
+    parser.add_argument("command", choices=["export", "check"])
+    parser.add_argument("model", help="model file in the model directory")
+    parser.add_argument("-o", "--output", help="artifact file (default: model/<name>.fmap)")
+    args = parser.parse_args(argv)
+
+    path = args.output or os.path.join(MODEL_DIR, mapped_path(args.model))
+    start = time.perf_counter()
+    model = load_model(args.model)
+    pickle_seconds = time.perf_counter() - start
+
+    if args.command == "export":
+        size = export_model(model, path, source_sha256=file_sha256(os.path.join(MODEL_DIR, args.model)))
+        print(f"Wrote {path}: {size / 1024:.0f} KiB")
+
+    start = time.perf_counter()
+    mapped = load_mapped(path)
+    mapped_seconds = time.perf_counter() - start
+    print(f"Load time: {pickle_seconds * 1000:.1f} ms from {args.model}, {mapped_seconds * 1000:.2f} ms mapped")
+
+    X = parity_inputs(model)
+    expected = model[1].inverse_transform(model[0].predict(X))
+    actual = mapped[1].inverse_transform(mapped[0].predict(X))
+    differs = (expected != actual) | (model[0].predict_proba(X) != mapped[0].predict_proba(X)).any(axis=1)
+    mismatches = int(differs.sum())
+    status = "OK" if mismatches == 0 else "MISMATCH"
+    print(f"{path}: {status} ({mismatches} of {len(X)} rows differ)")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
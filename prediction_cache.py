@@ -0,0 +1,91 @@
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+# Returned by PredictionCache.get on a miss (None can be a cached label)
+MISSING = object()
+
+
+class PredictionCache:
+    """Bounded LRU cache of predictions keyed on (model, mapped feature vector).
+
+    Keys are built from the final feature row, so inputs that differ only in
+    alias keys or unused fields share an entry. Entries expire after ``ttl``
+    seconds and the least recently used entry is evicted beyond ``maxsize``.
+    Entries of a model are dropped when the model object is freed or when
+    ``invalidate`` is called for it (e.g. by the model registry on a swap).
+    """
+
+    def __init__(self, maxsize=10000, ttl=3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # Reentrant: a finalizer may run (and invalidate) while the lock is held
+        self._lock = threading.RLock()
+        self._finalizers = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def model_key(self, model_instance):
+        """Return the identity used for ``model_instance`` in cache keys."""
+        key = id(model_instance)
+        if key not in self._finalizers:
+            with self._lock:
+                try:
+                    # Ids can be reused once a model is freed, so forget its entries then
+                    self._finalizers[key] = weakref.finalize(model_instance, self.invalidate, key)
+                except TypeError:
+                    self._finalizers[key] = None
+        return key
+
+    def make_key(self, model_instance, features):
+        return self.model_key(model_instance), features.tobytes()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            label, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return label
+
+    def put(self, key, label):
+        with self._lock:
+            self._entries[key] = (label, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, model_instance=None):
+        """Drop the entries of one model (an instance or its ``model_key``), or all entries."""
+        with self._lock:
+            if model_instance is None:
+                self._entries.clear()
+                return
+            key = model_instance if isinstance(model_instance, int) else id(model_instance)
+            for cache_key in [k for k in self._entries if k[0] == key]:
+                del self._entries[cache_key]
+            self._finalizers.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
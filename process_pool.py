@@ -0,0 +1,193 @@
+"""Process-pool backend for CPU-bound predictions.
+
+``PredictionPool`` loads the models once in the parent and then forks its
+workers, so every worker reads the same model pages (copy-on-write)
+instead of unpickling its own copy. ``gc.freeze`` moves the loaded models
+out of the garbage collector's reach first, so collections in the workers
+do not write to (and thereby copy) those pages.
+
+    with PredictionPool({"diet_plan": "diet_model.pkl"}, workers=4) as pool:
+        labels = pool.predict_batch("diet_plan", records)
+
+Large batches are split across the workers and the labels come back in
+input order. A worker that dies (e.g. killed by the OOM killer) breaks
+the underlying executor; the pool then starts a fresh set of workers and
+resubmits the affected tasks, up to ``max_restarts`` times in a row.
+
+Where fork is not available (Windows, or macOS defaults) the workers load
+the models themselves; results are the same, only memory is not shared.
+"""
+import gc
+import logging
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from registry import MODEL_FILES, load_models
+from utils import load_model, predict_batch, predict_with_model
+
+logger = logging.getLogger(__name__)
+
+# Batches smaller than this are not split further
+MIN_CHUNK = 1000
+
+# Models of this process when it is a pool worker
+_worker_models = None
+
+
+def _load_compiled(filename):
+    from forest_engine import compile_model
+
+    # Chunks of MIN_CHUNK rows and more are still predicted by sklearn
+    return compile_model(load_model(filename), keep_estimator=True)
+
+
+def _loader(compile_models):
+    return _load_compiled if compile_models else load_model
+
+
+def _init_worker(model_files, compile_models):
+    global _worker_models
+    _worker_models = load_models(model_files, _loader(compile_models))
+
+
+def _run(fn, args):
+    return fn(_worker_models, *args)
+
+
+def _predict_chunk(models, name, records):
+    return predict_batch(models[name], records)
+
+
+def _predict_one(models, name, input_data):
+    return predict_with_model(models[name], input_data)
+
+
+class PoolTask:
+    """A task submitted to a ``PredictionPool``; ``result`` resubmits it after a worker crash."""
+
+    def __init__(self, pool, fn, args):
+        self.pool = pool
+        self.fn = fn
+        self.args = args
+        self.executor, self.future = pool._submit(fn, args)
+
+    def result(self, timeout=None):
+        attempts = 0
+        while True:
+            try:
+                return self.future.result(timeout)
+            except BrokenProcessPool:
+                attempts += 1
+                if attempts > self.pool.max_restarts:
+                    raise
+                self.pool._restart(self.executor)
+                self.executor, self.future = self.pool._submit(self.fn, self.args)
+
+
+class PredictionPool:
+    """Worker processes sharing models that were loaded once before forking."""
+
+    def __init__(self, model_files=MODEL_FILES, workers=None, compile_models=False, max_restarts=3):
+        self.model_files = dict(model_files)
+        self.workers = workers or os.cpu_count() or 1
+        self.compile_models = compile_models
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+        methods = multiprocessing.get_all_start_methods()
+        self._fork = "fork" in methods
+        self._context = multiprocessing.get_context("fork" if self._fork else "spawn")
+
+        # Loaded here even without fork, to fail early and to expose .models
+        self.models = load_models(self.model_files, _loader(compile_models))
+        if not self.models:
+            raise Exception("No models could be loaded")
+        self._start()
+
+    def _start(self):
+        global _worker_models
+        if self._fork:
+            # Workers inherit the parent's models through fork
+            _worker_models = self.models
+            gc.freeze()
+            executor = ProcessPoolExecutor(self.workers, mp_context=self._context)
+        else:
+            executor = ProcessPoolExecutor(self.workers, mp_context=self._context, initializer=_init_worker,
+                                           initargs=(self.model_files, self.compile_models))
+        # Start every worker now rather than on the first large batch
+        for future in [executor.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+        self._executor = executor
+
+    def _restart(self, broken_executor):
+        with self._lock:
+            if self._executor is not broken_executor:
+                # Another task already restarted the pool
+                return
+            logger.warning("A prediction worker died; restarting the pool")
+            broken_executor.shutdown(wait=False, cancel_futures=True)
+            self.restarts += 1
+            self._start()
+
+    def _submit(self, fn, args):
+        if self._executor is None:
+            raise RuntimeError("The prediction pool is closed")
+        executor = self._executor
+        try:
+            return executor, executor.submit(_run, fn, args)
+        except BrokenProcessPool:
+            self._restart(executor)
+            executor = self._executor
+            return executor, executor.submit(_run, fn, args)
+
+    def submit(self, fn, *args):
+        """Run ``fn(models, *args)`` in a worker and return a ``PoolTask``.
+
+        ``fn`` must be picklable (a module-level function); ``models`` maps
+        the names in ``model_files`` to the worker's loaded model tuples.
+        """
+        return PoolTask(self, fn, args)
+
+    def predict_batch(self, name, records, chunk_size=None):
+        """Predict labels for ``records`` (list of input dicts or DataFrame) across the workers."""
+        if name not in self.models:
+            raise Exception(f"Model '{name}' is not available")
+        n = len(records)
+        if n == 0:
+            return []
+        if chunk_size is None:
+            chunk_size = max(MIN_CHUNK, math.ceil(n / self.workers))
+        slicer = records.iloc if hasattr(records, "iloc") else records
+        tasks = [self.submit(_predict_chunk, name, slicer[start:start + chunk_size])
+                 for start in range(0, n, chunk_size)]
+        labels = []
+        for task in tasks:
+            labels.extend(task.result())
+        return labels
+
+    def predict_with_model(self, name, input_data):
+        """Predict one input dict in a worker, like ``utils.predict_with_model``."""
+        if name not in self.models:
+            raise Exception(f"Model '{name}' is not available")
+        return self.submit(_predict_one, name, input_data).result()
+
+    def close(self):
+        """Stop the workers once the submitted tasks have finished."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+            if self._fork:
+                gc.unfreeze()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,298 @@
+import json
+from operator import attrgetter
+
+import numpy as np
+
+# Options offered by the form in app.py
+AGE_RANGE = (10, 100)
+WEIGHT_RANGE = (30.0, 200.0)
+HEIGHT_RANGE = (100.0, 250.0)
+GENDERS = ["Male", "Female"]
+FITNESS_GOALS = ["Lose Weight", "Gain Muscle", "Maintain Fitness"]
+DISEASE_TYPES = ["None", "Diabetes", "Hypertension", "Obesity"]
+SEVERITIES = ["None", "Mild", "Moderate", "Severe"]
+ACTIVITY_LEVELS = ["Sedentary", "Moderate", "Active"]
+DIETARY_RESTRICTIONS = ["None", "Low_Sodium", "Low_Sugar"]
+ALLERGIES = ["None", "Gluten", "Peanuts"]
+CUISINES = ["None", "Chinese", "Indian", "Italian", "Mexican"]
+
+# Form defaults, used for fields missing from a raw profile record
+DEFAULT_PROFILE = {
+    "age": 25,
+    "weight": 70.0,
+    "height": 170.0,
+    "gender": "Male",
+    "fitness_goal": "Lose Weight",
+    "disease_type": ["None"],
+    "severity": "None",
+    "activity_level": "Moderate",
+    "dietary_restrictions": ["None"],
+    "allergies": ["None"],
+    "preferred_cuisine": ["None"],
+}
+
+MULTISELECT_FIELDS = ["disease_type", "dietary_restrictions", "allergies", "preferred_cuisine"]
+
+# Values a raw profile record may use, as offered by the form
+FIELD_OPTIONS = {
+    "gender": GENDERS,
+    "fitness_goal": FITNESS_GOALS,
+    "disease_type": DISEASE_TYPES,
+    "severity": SEVERITIES,
+    "activity_level": ACTIVITY_LEVELS,
+    "dietary_restrictions": DIETARY_RESTRICTIONS,
+    "allergies": ALLERGIES,
+    "preferred_cuisine": CUISINES,
+}
+FIELD_RANGES = {"age": AGE_RANGE, "weight": WEIGHT_RANGE, "height": HEIGHT_RANGE}
+
+
+def calculate_bmi(weight_kg, height_cm):
+    """Calculate BMI from weight in kg and height in cm."""
+    height_m = height_cm / 100
+    return round(weight_kg / (height_m * height_m), 2)
+
+
+def _selected(option, selections):
+    # A multiselect that includes "None" means nothing is selected
+    return 1 if option in selections and "None" not in selections else 0
+
+
+# One field per distinct model input; Profile stores each value once
+PROFILE_FIELDS = (
+    "age", "weight", "height", "bmi",
+    "male", "female",
+    "diabetes", "hypertension", "obesity",
+    "severity_mild", "severity_moderate", "severity_severe",
+    "active", "moderately_active", "sedentary",
+    "low_sodium", "low_sugar",
+    "gluten_allergy", "peanut_allergy",
+    "chinese", "indian", "italian", "mexican",
+    "lose_weight", "gain_muscle", "maintain_fitness",
+)
+
+# Input names the models were trained with, in encode_profile's order, and
+# the field each one reads. Several names share a field (Weight/Weight_kg,
+# Sex_Male/Gender_Male, ...), as the training sets used different names.
+INPUT_FIELDS = [
+    ("Age", "age"),
+    ("Gender_Male", "male"),
+    ("Gender_Female", "female"),
+    ("Weight_kg", "weight"),
+    ("Height_cm", "height"),
+    ("BMI", "bmi"),
+    ("Weight", "weight"),
+    ("Height", "height"),
+    ("Sex_Male", "male"),
+    ("Sex_Female", "female"),
+    ("Disease_Type_Diabetes", "diabetes"),
+    ("Disease_Type_Hypertension", "hypertension"),
+    ("Disease_Type_Obesity", "obesity"),
+    ("Diabetes_Yes", "diabetes"),
+    ("Hypertension_Yes", "hypertension"),
+    ("Severity_Mild", "severity_mild"),
+    ("Severity_Moderate", "severity_moderate"),
+    ("Severity_Severe", "severity_severe"),
+    ("Physical_Activity_Level_Active", "active"),
+    ("Physical_Activity_Level_Moderate", "moderately_active"),
+    ("Physical_Activity_Level_Sedentary", "sedentary"),
+    ("Dietary_Restrictions_Low_Sodium", "low_sodium"),
+    ("Dietary_Restrictions_Low_Sugar", "low_sugar"),
+    ("Allergies_Gluten", "gluten_allergy"),
+    ("Allergies_Peanuts", "peanut_allergy"),
+    ("Preferred_Cuisine_Chinese", "chinese"),
+    ("Preferred_Cuisine_Indian", "indian"),
+    ("Preferred_Cuisine_Italian", "italian"),
+    ("Preferred_Cuisine_Mexican", "mexican"),
+    ("Fitness Goal_Lose Weight", "lose_weight"),
+    ("Fitness Goal_Gain Muscle", "gain_muscle"),
+    ("Fitness Goal_Maintain Fitness", "maintain_fitness"),
+    ("Fitness Goal_Weight Loss", "lose_weight"),
+    ("Fitness Goal_Weight Gain", "gain_muscle"),
+]
+
+_get_fields = attrgetter(*PROFILE_FIELDS)
+
+
+class Profile:
+    """A profile as one numeric value per field of PROFILE_FIELDS.
+
+    Models read it through their ``ProfileSchema`` (see feature_plan.py)
+    instead of looking up alias keys; ``to_input`` rebuilds the legacy
+    input dict where one is still needed.
+    """
+
+    __slots__ = PROFILE_FIELDS
+
+    def __init__(self, *values):
+        if len(values) != len(PROFILE_FIELDS):
+            raise TypeError(f"Profile takes {len(PROFILE_FIELDS)} values, one per field of PROFILE_FIELDS, "
+                            f"got {len(values)}")
+        for field, value in zip(PROFILE_FIELDS, values):
+            setattr(self, field, value)
+
+    @classmethod
+    def from_form(cls, age, weight, height, gender, fitness_goal, disease_type, severity,
+                  activity_level, dietary_restrictions, allergies, preferred_cuisine):
+        """Build a profile from the form's raw selections."""
+        return cls(
+            age, weight, height, calculate_bmi(weight, height),
+            1 if gender == "Male" else 0,
+            1 if gender == "Female" else 0,
+            _selected("Diabetes", disease_type),
+            _selected("Hypertension", disease_type),
+            _selected("Obesity", disease_type),
+            1 if severity == "Mild" else 0,
+            1 if severity == "Moderate" else 0,
+            1 if severity == "Severe" else 0,
+            1 if activity_level == "Active" else 0,
+            1 if activity_level == "Moderate" else 0,
+            1 if activity_level == "Sedentary" else 0,
+            _selected("Low_Sodium", dietary_restrictions),
+            _selected("Low_Sugar", dietary_restrictions),
+            _selected("Gluten", allergies),
+            _selected("Peanuts", allergies),
+            _selected("Chinese", preferred_cuisine),
+            _selected("Indian", preferred_cuisine),
+            _selected("Italian", preferred_cuisine),
+            _selected("Mexican", preferred_cuisine),
+            1 if fitness_goal == "Lose Weight" else 0,
+            1 if fitness_goal == "Gain Muscle" else 0,
+            1 if fitness_goal == "Maintain Fitness" else 0,
+        )
+
+    def to_array(self):
+        """Return the field values as a float64 array in PROFILE_FIELDS order."""
+        return np.array(_get_fields(self), dtype=np.float64)
+
+    def to_dict(self):
+        return dict(zip(PROFILE_FIELDS, _get_fields(self)))
+
+    def to_input(self):
+        """Return the legacy model input dict, with every alias key."""
+        return {key: getattr(self, field) for key, field in INPUT_FIELDS}
+
+    def __repr__(self):
+        return f"Profile({', '.join(f'{k}={v!r}' for k, v in self.to_dict().items())})"
+
+
+class ProfileBatch:
+    """Columnar profiles: an (n_profiles, len(PROFILE_FIELDS)) float64 array."""
+
+    __slots__ = ("values",)
+
+    def __init__(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim != 2 or values.shape[1] != len(PROFILE_FIELDS):
+            raise ValueError(f"Expected an array with {len(PROFILE_FIELDS)} columns, got shape {values.shape}")
+        self.values = values
+
+    @classmethod
+    def from_profiles(cls, profiles):
+        values = np.array([_get_fields(profile) for profile in profiles], dtype=np.float64)
+        return cls(values.reshape(-1, len(PROFILE_FIELDS)))
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        """Return a sub-batch for a slice or index array."""
+        return ProfileBatch(self.values[index])
+
+    def column(self, field):
+        return self.values[:, PROFILE_FIELDS.index(field)]
+
+
+def encode_profile(age, weight, height, gender, fitness_goal, disease_type, severity,
+                   activity_level, dietary_restrictions, allergies, preferred_cuisine):
+    """Build the model input dict from the form's raw selections."""
+    return Profile.from_form(age, weight, height, gender, fitness_goal, disease_type, severity,
+                             activity_level, dietary_restrictions, allergies, preferred_cuisine).to_input()
+
+
+def _parse_multiselect(value):
+    if value is None:
+        return ["None"]
+    if isinstance(value, (list, tuple)):
+        items = [str(v).strip() for v in value]
+    else:
+        text = str(value).strip()
+        if text.startswith('['):
+            items = [str(v).strip() for v in json.loads(text)]
+        else:
+            items = [v.strip() for v in text.replace('|', ';').replace(',', ';').split(';')]
+    items = [v for v in items if v]
+    return items or ["None"]
+
+
+def parse_profile(record):
+    """Normalize a raw profile record (e.g. a CSV row) into encode_profile arguments.
+
+    Numeric fields may be strings, multiselect fields may be lists or strings
+    separated by ';', '|' or ','. Missing or empty fields take the form defaults.
+    Raises ValueError for values the form does not offer (unknown options,
+    numbers outside its ranges), which the models would otherwise score as
+    if nothing had been selected.
+    """
+    profile = {}
+    for field, default in DEFAULT_PROFILE.items():
+        value = record.get(field)
+        if value is None or value == "":
+            profile[field] = list(default) if isinstance(default, list) else default
+        elif field in MULTISELECT_FIELDS:
+            profile[field] = _parse_multiselect(value)
+        elif field == "age":
+            profile[field] = int(float(value))
+        elif field in ("weight", "height"):
+            profile[field] = float(value)
+        else:
+            profile[field] = str(value).strip()
+
+        if field in FIELD_RANGES:
+            low, high = FIELD_RANGES[field]
+            if not low <= profile[field] <= high:
+                raise ValueError(f"{field} must be between {low:g} and {high:g}, got {value!r}")
+        elif field in FIELD_OPTIONS:
+            values = profile[field] if field in MULTISELECT_FIELDS else [profile[field]]
+            unknown = [v for v in values if v not in FIELD_OPTIONS[field]]
+            if unknown:
+                raise ValueError(f"{field} must be one of {', '.join(FIELD_OPTIONS[field])}, "
+                                 f"got {', '.join(map(repr, unknown))}")
+    return profile
+
+
+def random_profile(rng):
+    """Draw a random set of form selections, e.g. for benchmarks and parity checks.
+
+    ``rng`` is a ``random.Random``; numeric fields are uniform over the form's
+    ranges and each multiselect picks "None" or a random subset of options.
+    """
+    def multiselect(options):
+        if rng.random() < 0.3:
+            return ["None"]
+        picked = [option for option in options[1:] if rng.random() < 0.5]
+        return picked or ["None"]
+
+    return {
+        "age": rng.randint(*AGE_RANGE),
+        "weight": round(rng.uniform(*WEIGHT_RANGE), 1),
+        "height": round(rng.uniform(*HEIGHT_RANGE), 1),
+        "gender": rng.choice(GENDERS),
+        "fitness_goal": rng.choice(FITNESS_GOALS),
+        "disease_type": multiselect(DISEASE_TYPES),
+        "severity": rng.choice(SEVERITIES),
+        "activity_level": rng.choice(ACTIVITY_LEVELS),
+        "dietary_restrictions": multiselect(DIETARY_RESTRICTIONS),
+        "allergies": multiselect(ALLERGIES),
+        "preferred_cuisine": multiselect(CUISINES),
+    }
+
+
+def encode_record(record):
+    """Parse a raw profile record and build its model input dict."""
+    return encode_profile(**parse_profile(record))
+
+
+def profile_from_record(record):
+    """Parse a raw profile record into a ``Profile``."""
+    return Profile.from_form(**parse_profile(record))
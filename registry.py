@@ -0,0 +1,336 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from feature_plan import get_plan
+from forest_engine import compile_model
+from model_format import is_mapped_array, load_mapped, mapped_path, read_header
+from utils import MODEL_DIR, load_model
+
+logger = logging.getLogger(__name__)
+
+# Model file behind each plan, shared by the app, the scoring tools and the service
+MODEL_FILES = {"workout_plan": "gym_model.pkl", "diet_plan": "diet_model.pkl"}
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def estimate_model_memory(obj, _seen=None):
+    """Estimate the bytes held by a loaded model (arrays, trees and containers)."""
+    if _seen is None:
+        _seen = {}
+    if id(obj) in _seen:
+        return 0
+    # Keep a reference so temporary objects (e.g. pickled tree state) keep their id
+    _seen[id(obj)] = obj
+
+    if isinstance(obj, np.ndarray):
+        # Mapped arrays live in the shared page cache, not in this process
+        return 0 if is_mapped_array(obj) else obj.nbytes
+    if isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        return 0
+    if isinstance(obj, dict):
+        return sum(estimate_model_memory(v, _seen) for v in obj.values())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sum(estimate_model_memory(v, _seen) for v in obj)
+
+    # sklearn Tree objects keep their node arrays in C memory; their pickled
+    # state exposes those arrays, which is what we want to count.
+    if type(obj).__name__ == 'Tree' and hasattr(obj, '__getstate__'):
+        try:
+            return estimate_model_memory(obj.__getstate__(), _seen)
+        except Exception:
+            return 0
+
+    state = getattr(obj, '__dict__', None)
+    if state is not None:
+        return estimate_model_memory(state, _seen)
+    return 0
+
+
+def load_models(model_files=MODEL_FILES, loader=load_model):
+    """Load ``{name: filename}`` with ``loader``, warning about the models that fail."""
+    models = {}
+    for name, filename in model_files.items():
+        try:
+            models[name] = loader(filename)
+        except Exception as e:
+            logger.warning("%s not available: %s", name, e)
+    return models
+
+
+def validate_model(model):
+    """Raise ValueError unless ``model`` is a usable ``(model, label_encoder, feature_columns)`` tuple."""
+    if not isinstance(model, (tuple, list)) or len(model) != 3:
+        raise ValueError(f"Expected a (model, label_encoder, feature_columns) tuple, got {type(model).__name__}")
+    model_instance, label_encoder, feature_columns = model
+    if not (hasattr(model_instance, 'predict') and hasattr(model_instance, 'predict_proba')):
+        raise ValueError(f"{type(model_instance).__name__} has no predict/predict_proba")
+    if not hasattr(label_encoder, 'inverse_transform'):
+        raise ValueError(f"{type(label_encoder).__name__} has no inverse_transform")
+    if not isinstance(feature_columns, (list, tuple)) or not all(isinstance(c, str) for c in feature_columns):
+        raise ValueError("feature_columns must be a list of column names")
+    n_features = getattr(model_instance, 'n_features_in_', getattr(model_instance, 'n_features', None))
+    if n_features is not None and n_features != len(feature_columns):
+        raise ValueError(f"Model expects {n_features} features but {len(feature_columns)} columns are listed")
+
+
+class ModelEntry:
+    """A loaded model artifact together with its file signature and load stats."""
+
+    def __init__(self, filename, path, model, mtime_ns, size, sha256, load_seconds, memory_bytes, source=None):
+        self.filename = filename
+        self.path = path
+        # File the model was actually read from (a mapped export of ``path``, or ``path``)
+        self.source = source or path
+        self.model = model
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.sha256 = sha256
+        self.load_seconds = load_seconds
+        self.memory_bytes = memory_bytes
+        self.loaded_at = time.time()
+        self.version = 1
+
+    def stats(self):
+        return {
+            "filename": self.filename,
+            "source": os.path.basename(self.source),
+            "sha256": self.sha256,
+            "size_bytes": self.size,
+            "load_ms": round(self.load_seconds * 1000, 2),
+            "memory_mb": round(self.memory_bytes / (1024 * 1024), 2),
+            "version": self.version,
+            "loaded_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.loaded_at)),
+        }
+
+
+class ModelRegistry:
+    """Process-wide cache of model artifacts, reloaded when the file on disk changes.
+
+    Every ``get`` stats the file; the SHA-256 is only recomputed when the
+    mtime or size differ from the cached entry, so the common path costs a
+    single ``os.stat``. A changed file is fully loaded and checked (see
+    ``validate_model``) before it replaces the cached model, and a failed
+    reload keeps serving the previous model; the failed file is not tried
+    again until it changes. While one thread reloads a file, other callers
+    keep getting the previous model instead of waiting.
+
+    With ``compile_forests`` the registry serves the NumPy compiled form of
+    tree ensembles (see forest_engine.py), which predicts the same labels.
+    It is faster on small batches only, so the sklearn model is kept for
+    batches of ``CompiledForest.sklearn_rows`` rows or more. If a
+    memory-mapped export of the file exists (see model_format.py) and was
+    made from this exact file, it is mapped instead of unpickling, which
+    also avoids importing sklearn; large batches then take the slower
+    compiled path, as there is no sklearn model to hand them to. ``loader`` is called with the
+    file's absolute path.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, loader=load_model, compile_forests=True):
+        # Absolute, so the loader is given the file itself rather than a
+        # name it would resolve against its own directory
+        self.model_dir = os.path.abspath(model_dir)
+        self.loader = loader
+        self.compile_forests = compile_forests
+        self._entries = {}
+        self._errors = {}
+        # (mtime_ns, size) of files that failed to load, to not retry them on every get
+        self._failed = {}
+        self._lock = threading.Lock()
+        self._file_locks = {}
+        self._listeners = []
+
+    def _file_lock(self, filename):
+        with self._lock:
+            lock = self._file_locks.get(filename)
+            if lock is None:
+                lock = self._file_locks[filename] = threading.Lock()
+            return lock
+
+    def get(self, filename):
+        """Return the loaded model for ``filename``, loading or reloading it if needed."""
+        path = os.path.join(self.model_dir, filename)
+        entry = self._entries.get(filename)
+
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            if entry is not None:
+                # Keep serving the last good model while the file is being replaced
+                return entry.model
+            raise FileNotFoundError(f"Model file not found at: {path}")
+
+        if entry is not None and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+            return entry.model
+        if self._failed.get(filename) == (st.st_mtime_ns, st.st_size):
+            if entry is not None:
+                return entry.model
+            raise Exception(self._errors.get(filename))
+
+        # Only one thread loads a given file. Without a previous model the
+        # others wait and reuse its result; with one they keep serving it.
+        lock = self._file_lock(filename)
+        if not lock.acquire(blocking=entry is None):
+            return entry.model
+        try:
+            entry = self._entries.get(filename)
+            st = os.stat(path)
+            if entry is not None and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+                return entry.model
+            if self._failed.get(filename) == (st.st_mtime_ns, st.st_size):
+                if entry is not None:
+                    return entry.model
+                raise Exception(self._errors.get(filename))
+
+            sha256 = file_sha256(path)
+            if entry is not None and entry.sha256 == sha256:
+                # Touched but unchanged: just remember the new signature
+                entry.mtime_ns = st.st_mtime_ns
+                entry.size = st.st_size
+                return entry.model
+
+            try:
+                start = time.perf_counter()
+                source = self._mapped_source(path, sha256)
+                model = load_mapped(source) if source else self.loader(path)
+                validate_model(model)
+                if self.compile_forests:
+                    try:
+                        model = compile_model(model, keep_estimator=True)
+                    except (TypeError, ValueError):
+                        # Only models that are not tree ensembles are served as loaded
+                        if hasattr(model[0], 'estimators_') or hasattr(model[0], 'tree_'):
+                            raise
+                # Compile the feature mapping now rather than on the first request
+                get_plan(model[2])
+                load_seconds = time.perf_counter() - start
+            except Exception as e:
+                self._errors[filename] = str(e)
+                self._failed[filename] = (st.st_mtime_ns, st.st_size)
+                logger.warning("Loading %s failed: %s", filename, e)
+                if entry is not None:
+                    return entry.model
+                raise
+
+            new_entry = ModelEntry(filename, path, model, st.st_mtime_ns, st.st_size, sha256,
+                                   load_seconds, estimate_model_memory(model), source)
+            if entry is not None:
+                new_entry.version = entry.version + 1
+            with self._lock:
+                self._entries[filename] = new_entry
+                self._errors.pop(filename, None)
+                self._failed.pop(filename, None)
+            if entry is not None:
+                self._notify(filename, entry.model, model)
+            return model
+        finally:
+            lock.release()
+
+    def _mapped_source(self, path, sha256):
+        # Only serve an export that matches the current file; anything else is stale
+        if not self.compile_forests:
+            return None
+        mapped = mapped_path(path)
+        if mapped == path or not os.path.exists(mapped):
+            return None
+        try:
+            if read_header(mapped).get("source_sha256") == sha256:
+                return mapped
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring mapped model %s: %s", mapped, e)
+        return None
+
+    def warm_up(self, filenames):
+        """Load ``filenames`` on a background thread; return the thread.
+
+        ``get`` waits on the same per-file lock, so a request that arrives
+        while a model is still loading blocks until it is ready instead of
+        loading it a second time. Failures are kept for ``stats``.
+        """
+        def run():
+            for filename in filenames:
+                try:
+                    self.get(filename)
+                except Exception as e:
+                    self._errors[filename] = str(e)
+                    logger.warning("Warm-up of %s failed: %s", filename, e)
+
+        thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def error(self, filename):
+        """Return the last load error for ``filename``, or None."""
+        return self._errors.get(filename)
+
+    def add_listener(self, callback):
+        """Call ``callback(filename, old_model, new_model)`` whenever a cached model is replaced."""
+        self._listeners.append(callback)
+
+    def _notify(self, filename, old_model, new_model):
+        for callback in list(self._listeners):
+            try:
+                callback(filename, old_model, new_model)
+            except Exception as e:
+                logger.warning("Model registry listener failed: %s", e)
+
+    def entry(self, filename):
+        """Return the cached ``ModelEntry`` for ``filename`` or None."""
+        return self._entries.get(filename)
+
+    def stats(self):
+        """Return load time, memory and version information for every loaded model."""
+        with self._lock:
+            entries = list(self._entries.values())
+            errors = dict(self._errors)
+        stats = [entry.stats() for entry in entries]
+        for stat in stats:
+            if stat["filename"] in errors:
+                stat["last_error"] = errors[stat["filename"]]
+        return stats
+
+    def clear(self):
+        """Drop every cached model."""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+            self._errors.clear()
+        for entry in entries:
+            self._notify(entry.filename, entry.model, None)
+
+
+# Shared by every session in this process; Streamlit reruns app.py but keeps
+# imported modules, so this survives widget changes and form submits.
+default_registry = ModelRegistry()
+
+_warmup_thread = None
+
+
+def get_model(filename):
+    """Load ``filename`` through the process-wide registry."""
+    return default_registry.get(filename)
+
+
+def model_stats():
+    """Return stats for every model in the process-wide registry."""
+    return default_registry.stats()
+
+
+def warm_up(filenames):
+    """Start loading ``filenames`` into the process-wide registry, once per process."""
+    global _warmup_thread
+    if _warmup_thread is None:
+        _warmup_thread = default_registry.warm_up(list(filenames))
+    return _warmup_thread
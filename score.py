@@ -0,0 +1,199 @@
+"""Offline bulk scoring of user profiles.
+
+Reads raw profiles (the same fields as the form in app.py) from a CSV or
+JSONL file as a stream and writes a workout and diet plan per record:
+
+    python score.py profiles.csv -o plans.jsonl --chunk-size 5000 --workers 4
+
+With ``--state`` only records whose features (or the model) changed since
+the previous run with the same state file are predicted again; see
+score_store.py.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+from process_pool import PredictionPool
+from profiles import ProfileBatch, profile_from_record
+from registry import MODEL_FILES, load_models
+from score_store import open_scorer
+from utils import MODEL_DIR, predict_batch
+
+
+def read_records(path, input_format=None):
+    """Yield raw profile dicts from a CSV or JSONL file (``-`` for stdin)."""
+    if input_format is None:
+        input_format = "csv" if path.lower().endswith(".csv") else "jsonl"
+
+    f = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+    try:
+        if input_format == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def chunked(records, chunk_size):
+    """Yield lists of at most ``chunk_size`` records."""
+    iterator = iter(records)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _predict_labels(output, model, inputs, ids):
+    return predict_batch(model, inputs)
+
+
+def score_chunk(models, chunk, start_index=0, predict=_predict_labels):
+    """Score a chunk of raw records, returning one output dict per record.
+
+    ``predict(output, model, inputs, ids)`` returns the labels of the valid
+    records, given as a ``ProfileBatch`` together with their ids (as str);
+    score_store.IncrementalScorer uses it to only predict changed records.
+    """
+    results = []
+    encoded = []
+    for offset, record in enumerate(chunk):
+        result = {"id": record.get("id", start_index + offset)}
+        try:
+            encoded.append((len(results), profile_from_record(record)))
+        except Exception as e:
+            result["error"] = f"Invalid profile: {e}"
+        results.append(result)
+
+    # Columnar: one row of canonical fields per profile
+    inputs = ProfileBatch.from_profiles(profile for _, profile in encoded)
+    ids = [str(results[position]["id"]) for position, _ in encoded]
+    for output in MODEL_FILES:
+        model = models.get(output)
+        labels = predict(output, model, inputs, ids) if model is not None else [None] * len(inputs)
+        for (position, _), label in zip(encoded, labels):
+            results[position][output] = label
+    return results
+
+
+def score_stream(records, chunk_size=1000, workers=1, model_files=MODEL_FILES):
+    """Yield lists of scored results, one per input chunk, in input order.
+
+    With ``workers > 1`` chunks are scored in a ``PredictionPool``, whose
+    workers share the models loaded here; at most two chunks per worker
+    are in flight so memory stays bounded.
+    """
+    chunks = ((chunk, index * chunk_size) for index, chunk in enumerate(chunked(records, chunk_size)))
+
+    if workers <= 1:
+        models = load_models(model_files)
+        if not models:
+            raise Exception("No models could be loaded")
+        for chunk, start_index in chunks:
+            yield score_chunk(models, chunk, start_index)
+        return
+
+    with PredictionPool(model_files, workers) as pool:
+        pending = []
+        for chunk, start_index in chunks:
+            pending.append(pool.submit(score_chunk, chunk, start_index))
+            if len(pending) >= workers * 2:
+                yield pending.pop(0).result()
+        for task in pending:
+            yield task.result()
+
+
+def score_incremental(records, state_path, chunk_size=1000, model_files=MODEL_FILES):
+    """Like ``score_stream``, but reuse the labels stored in ``state_path`` for unchanged records."""
+    models = load_models(model_files)
+    if not models:
+        raise Exception("No models could be loaded")
+    model_paths = {output: os.path.join(MODEL_DIR, filename) for output, filename in model_files.items()}
+    scorer = open_scorer(state_path, models, model_paths)
+    try:
+        for index, chunk in enumerate(chunked(records, chunk_size)):
+            yield scorer.score_chunk(chunk, index * chunk_size)
+    finally:
+        scorer.store.close()
+        print(f"{scorer.predicted} predictions made, {scorer.reused} reused from {state_path}", file=sys.stderr)
+
+
+class ResultWriter:
+    """Write scored results as JSONL or CSV."""
+
+    FIELDS = ["id", "workout_plan", "diet_plan", "error"]
+
+    def __init__(self, f, output_format):
+        self.f = f
+        self.csv_writer = None
+        if output_format == "csv":
+            self.csv_writer = csv.DictWriter(f, fieldnames=self.FIELDS, extrasaction="ignore")
+            self.csv_writer.writeheader()
+
+    def write(self, results):
+        if self.csv_writer is not None:
+            self.csv_writer.writerows(results)
+        else:
+            self.f.writelines(json.dumps(result) + "\n" for result in results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score user profiles from a CSV or JSONL file.")
+    parser.add_argument("input", help="CSV or JSONL file of profiles, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="output file (.csv or .jsonl), default stdout")
+    parser.add_argument("--input-format", choices=["csv", "jsonl"], help="override input format detection")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="records scored per model call")
+    parser.add_argument("--workers", type=int, default=1, help="score chunks in this many processes")
+    parser.add_argument("--gym-model", default=MODEL_FILES["workout_plan"])
+    parser.add_argument("--diet-model", default=MODEL_FILES["diet_plan"])
+    parser.add_argument("--progress-every", type=int, default=100000, help="report throughput every N rows")
+    parser.add_argument("--state", help="SQLite file of previous results; only changed records are re-predicted")
+    args = parser.parse_args(argv)
+    if args.state and args.workers > 1:
+        parser.error("--state scores in a single process; it cannot be combined with --workers")
+
+    model_files = {"workout_plan": args.gym_model, "diet_plan": args.diet_model}
+    output_format = "csv" if args.output.lower().endswith(".csv") else "jsonl"
+    out = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+
+    rows = 0
+    start = time.perf_counter()
+    next_report = args.progress_every
+    try:
+        writer = ResultWriter(out, output_format)
+        records = read_records(args.input, args.input_format)
+        if args.state:
+            stream = score_incremental(records, args.state, args.chunk_size, model_files)
+        else:
+            stream = score_stream(records, args.chunk_size, args.workers, model_files)
+        for results in stream:
+            writer.write(results)
+            rows += len(results)
+            if rows >= next_report:
+                elapsed = time.perf_counter() - start
+                print(f"{rows} rows, {rows / elapsed:,.0f} rows/s", file=sys.stderr)
+                next_report += args.progress_every
+    except Exception as e:
+        print(f"Scoring failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    rate = rows / elapsed if elapsed > 0 else 0.0
+    print(f"Scored {rows} rows in {elapsed:.2f}s ({rate:,.0f} rows/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
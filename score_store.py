@@ -0,0 +1,137 @@
+"""Incremental scoring state for score.py.
+
+``ScoreStore`` keeps, in a local SQLite file, the last label of every
+(record id, output) together with what it was computed from: a
+fingerprint of the record's mapped feature vector for that model and the
+SHA-256 of the model artifact. ``IncrementalScorer`` only re-predicts
+records whose fingerprint or model hash differ from the stored ones and
+updates those rows in place; everything else is answered from the store.
+
+    python score.py members.csv -o plans.jsonl --state scores.sqlite
+"""
+import hashlib
+import os
+import sqlite3
+import time
+
+from feature_plan import get_schema
+from utils import predict_batch
+
+# Ids looked up per query; stays below SQLite's bound-parameter limit
+LOOKUP_BATCH = 500
+
+# ``label`` has no declared type, so SQLite stores labels as given: with
+# TEXT affinity numeric labels came back as strings when reused
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id TEXT NOT NULL,
+    output TEXT NOT NULL,
+    fingerprint BLOB NOT NULL,
+    model_sha256 TEXT NOT NULL,
+    label,
+    scored_at REAL NOT NULL,
+    PRIMARY KEY (id, output)
+)
+"""
+
+
+def fingerprint_rows(features):
+    """Return a 16-byte digest of each feature row."""
+    return [hashlib.blake2b(row.tobytes(), digest_size=16).digest() for row in features]
+
+
+class ScoreStore:
+    """Last label per (record id, output) with the fingerprint and model hash it came from."""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        label_type = [row[2] for row in self.conn.execute("PRAGMA table_info(results)") if row[1] == "label"]
+        if label_type and label_type[0]:
+            # Written with a typed label column; its labels may have been converted
+            self.conn.execute("DROP TABLE results")
+        self.conn.execute(SCHEMA)
+        self.conn.commit()
+
+    def lookup(self, output, ids):
+        """Return ``{id: (fingerprint, model_sha256, label)}`` for the stored ``ids``."""
+        found = {}
+        for start in range(0, len(ids), LOOKUP_BATCH):
+            batch = ids[start:start + LOOKUP_BATCH]
+            query = (f"SELECT id, fingerprint, model_sha256, label FROM results "
+                     f"WHERE output = ? AND id IN ({','.join('?' * len(batch))})")
+            for record_id, fingerprint, model_sha256, label in self.conn.execute(query, [output, *batch]):
+                found[record_id] = (fingerprint, model_sha256, label)
+        return found
+
+    def save(self, output, rows):
+        """Insert or update ``(id, fingerprint, model_sha256, label)`` rows for ``output``."""
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO results (id, output, fingerprint, model_sha256, label, scored_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (id, output) DO UPDATE SET fingerprint = excluded.fingerprint, "
+                "model_sha256 = excluded.model_sha256, label = excluded.label, scored_at = excluded.scored_at",
+                [(record_id, output, fingerprint, model_sha256, label, now)
+                 for record_id, fingerprint, model_sha256, label in rows],
+            )
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+class IncrementalScorer:
+    """Score chunks of raw records, predicting only what changed since the stored run.
+
+    ``models`` maps an output name to a model tuple and ``model_hashes`` to
+    the SHA-256 of the artifact it was loaded from.
+    """
+
+    def __init__(self, store, models, model_hashes):
+        self.store = store
+        self.models = models
+        self.model_hashes = model_hashes
+        self.predicted = 0
+        self.reused = 0
+
+    def score_chunk(self, chunk, start_index=0):
+        """Score a chunk of raw records through ``score.score_chunk``, with the stored labels."""
+        from score import score_chunk
+
+        return score_chunk(self.models, chunk, start_index, predict=self._predict)
+
+    def _predict(self, output, model, batch, ids):
+        model_sha256 = self.model_hashes[output]
+        fingerprints = fingerprint_rows(get_schema(model[2]).apply_batch(batch))
+        stored = self.store.lookup(output, ids)
+
+        labels = [None] * len(ids)
+        changed = []
+        for i, (record_id, fingerprint) in enumerate(zip(ids, fingerprints)):
+            previous = stored.get(record_id)
+            if previous is not None and previous[0] == fingerprint and previous[1] == model_sha256:
+                labels[i] = previous[2]
+            else:
+                changed.append(i)
+
+        if changed:
+            for i, label in zip(changed, predict_batch(model, batch[changed])):
+                labels[i] = label
+            self.store.save(output, [(ids[i], fingerprints[i], model_sha256, labels[i]) for i in changed])
+        self.predicted += len(changed)
+        self.reused += len(ids) - len(changed)
+        return labels
+
+
+def open_scorer(path, models, model_paths):
+    """Open (or create) the store at ``path`` and return an ``IncrementalScorer`` for ``models``."""
+    from registry import file_sha256
+
+    hashes = {output: file_sha256(model_paths[output]) for output in models}
+    return IncrementalScorer(ScoreStore(os.fspath(path)), models, hashes)
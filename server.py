@@ -0,0 +1,271 @@
+"""Standalone HTTP JSON inference service for the diet and gym models.
+
+Uses only the standard library's asyncio. Requests that arrive within a
+short window are coalesced into one ``predict_batch`` call per model, which
+runs on a thread pool so the event loop keeps accepting connections.
+
+    python server.py --port 8000 --batch-window-ms 5 --max-batch 64
+
+    curl -X POST localhost:8000/predict -d '{"age": 30, "weight": 80, "height": 180}'
+
+Endpoints:
+    GET  /health          loaded models and batching stats
+    GET  /metrics         prediction counters and latency histograms (Prometheus text format)
+    POST /predict         workout and diet plan for a profile (or a list of profiles)
+    POST /predict/gym     workout plan only
+    POST /predict/diet    diet plan only
+
+Profiles use the form's fields (see profiles.DEFAULT_PROFILE); missing
+fields take the form defaults.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from instrumentation import configure_instrumentation, get_metrics
+from profiles import ProfileBatch, profile_from_record
+from registry import MODEL_FILES, get_model, load_models, model_stats
+from utils import predict_batch, predict_with_model
+
+ROUTES = {"/predict": ["workout_plan", "diet_plan"], "/predict/gym": ["workout_plan"], "/predict/diet": ["diet_plan"]}
+
+MAX_BODY_BYTES = 1 << 20
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class MicroBatcher:
+    """Coalesce concurrent predictions for one model into batched calls.
+
+    A batch is flushed ``window`` seconds after its first request arrives,
+    or as soon as it holds ``max_batch`` requests.
+    """
+
+    def __init__(self, filename, executor, window=0.005, max_batch=64):
+        self.filename = filename
+        self.executor = executor
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+        # Running batch tasks; the event loop only keeps weak references
+        self._tasks = set()
+        self.batches = 0
+        self.requests = 0
+
+    async def predict(self, profile):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((profile, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            self.batches += 1
+            self.requests += len(batch)
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _predict(self, profiles):
+        model = get_model(self.filename)
+        try:
+            return [(True, label) for label in predict_batch(model, ProfileBatch.from_profiles(profiles))]
+        except Exception:
+            # Isolate the failing request(s) instead of failing the whole batch
+            results = []
+            for profile in profiles:
+                try:
+                    results.append((True, predict_with_model(model, profile)))
+                except Exception as e:
+                    results.append((False, e))
+            return results
+
+    async def _run(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, self._predict, [item for item, _ in batch])
+        except Exception as e:
+            results = [(False, e)] * len(batch)
+        for (_, future), (ok, value) in zip(batch, results):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+class InferenceServer:
+    def __init__(self, window=0.005, max_batch=64, threads=2):
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="predict")
+        self.batchers = {
+            output: MicroBatcher(filename, self.executor, window, max_batch)
+            for output, filename in MODEL_FILES.items()
+        }
+        self.available = list(MODEL_FILES)
+
+    def load_models(self):
+        """Load every model through the registry; return the outputs that are available."""
+        self.available = list(load_models(MODEL_FILES, get_model))
+        return self.available
+
+    async def predict_profile(self, record, outputs):
+        try:
+            profile = profile_from_record(record)
+        except Exception as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Invalid profile: {e}")
+        labels = await asyncio.gather(*(self.batchers[output].predict(profile) for output in outputs))
+        return dict(zip(outputs, labels))
+
+    async def dispatch(self, method, path, body):
+        if path == "/health":
+            if method != "GET":
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET")
+            return {
+                "status": "ok",
+                "models": model_stats(),
+                "batching": {output: batcher.stats() for output, batcher in self.batchers.items()},
+            }
+        if path == "/metrics":
+            if method != "GET":
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET")
+            metrics = get_metrics()
+            if metrics is None:
+                raise HTTPError(HTTPStatus.NOT_FOUND, "Metrics are disabled")
+            return metrics.render_prometheus()
+
+        outputs = ROUTES.get(path)
+        if outputs is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Unknown path {path}")
+        if method != "POST":
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use POST")
+        if len(outputs) > 1:
+            # The combined endpoint answers with whichever models are loaded
+            outputs = [output for output in outputs if output in self.available] or outputs
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Invalid JSON: {e}")
+
+        try:
+            if isinstance(payload, list):
+                return await asyncio.gather(*(self.predict_profile(p, outputs) for p in payload))
+            if isinstance(payload, dict):
+                return await self.predict_profile(payload, outputs)
+        except FileNotFoundError as e:
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, str(e))
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Expected a JSON object or a list of objects")
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                # Digits only: int() would also take signs, spaces and underscores
+                content_length = headers.get("content-length") or "0"
+                length = int(content_length) if content_length.isascii() and content_length.isdigit() else None
+                status = HTTPStatus.OK
+                if length is None:
+                    status, result = HTTPStatus.BAD_REQUEST, {"error": "Invalid Content-Length"}
+                    keep_alive = False
+                elif length > MAX_BODY_BYTES:
+                    status, result = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Request body too large"}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    keep_alive = (version == "HTTP/1.1" and headers.get("connection", "").lower() != "close")
+                    try:
+                        result = await self.dispatch(method, path.split("?", 1)[0], body)
+                    except HTTPError as e:
+                        status, result = e.status, {"error": str(e)}
+                    except Exception as e:
+                        status, result = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"Prediction failed: {e}"}
+
+                if isinstance(result, str):
+                    payload, content_type = result.encode(), "text/plain; version=0.0.4"
+                else:
+                    payload, content_type = json.dumps(result).encode(), "application/json"
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+        print(f"Serving on http://{host}:{port}", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve diet and gym predictions over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--batch-window-ms", type=float, default=5.0, help="max wait before a batch is scored")
+    parser.add_argument("--max-batch", type=int, default=64, help="score a batch as soon as it has this many requests")
+    parser.add_argument("--threads", type=int, default=2, help="threads running model predictions")
+    parser.add_argument("--no-metrics", action="store_true", help="do not collect prediction metrics")
+    args = parser.parse_args(argv)
+
+    if not args.no_metrics:
+        configure_instrumentation()
+
+    server = InferenceServer(args.batch_window_ms / 1000, args.max_batch, args.threads)
+    if not server.load_models():
+        print("No models could be loaded", file=sys.stderr)
+        return 1
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""Startup profile: which imports dominate a cold start, and how long until the first prediction.
+
+Runs each target in a new interpreter with ``python -X importtime`` and
+reports the slowest imports by cumulative time and the totals per
+top-level package. It then times, in another new process, importing the
+prediction modules, loading a model through the registry and making one
+prediction.
+
+    python startup_profile.py
+    python startup_profile.py --modules utils streamlit --top 15 --json startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+DEFAULT_MODULES = ["utils", "registry", "server", "streamlit"]
+
+FIRST_PREDICTION = """
+import json, sys, time
+start = time.perf_counter()
+from profiles import DEFAULT_PROFILE, encode_profile
+from registry import get_model
+from utils import predict_with_model
+imported = time.perf_counter()
+model = get_model(sys.argv[1])
+loaded = time.perf_counter()
+predict_with_model(model, encode_profile(**DEFAULT_PROFILE))
+done = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "load_ms": (loaded - imported) * 1000,
+    "predict_ms": (done - loaded) * 1000,
+    "total_ms": (done - start) * 1000,
+    "sklearn_imported": "sklearn" in sys.modules,
+    "modules_loaded": len(sys.modules),
+}))
+"""
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_times(module):
+    """Return ``[(name, self_us, cumulative_us)]`` for ``import module`` in a new interpreter."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=BASE_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def profile_module(module, top=10):
+    rows = import_times(module)
+    total_us = max((cumulative for _, _, cumulative in rows), default=0)
+    packages = {}
+    for name, self_us, _ in rows:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+    return {
+        "module": module,
+        "total_ms": round(total_us / 1000, 1),
+        "modules_imported": len(rows),
+        "slowest": [{"module": name, "cumulative_ms": round(cumulative / 1000, 1), "self_ms": round(self_us / 1000, 1)}
+                    for name, self_us, cumulative in sorted(rows, key=lambda row: -row[2])[:top]],
+        "packages": [{"package": package, "self_ms": round(us / 1000, 1)}
+                     for package, us in sorted(packages.items(), key=lambda item: -item[1])[:top]],
+    }
+
+
+def first_prediction(filename):
+    """Time import, registry load and one prediction of ``filename`` in a new process."""
+    result = subprocess.run([sys.executable, "-W", "ignore", "-c", FIRST_PREDICTION, filename],
+                            cwd=BASE_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    from registry import MODEL_FILES
+
+    parser = argparse.ArgumentParser(description="Profile imports and time to first prediction.")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES, help="modules to import")
+    parser.add_argument("--models", nargs="+", default=list(MODEL_FILES.values()),
+                        help="model files to time the first prediction with")
+    parser.add_argument("--top", type=int, default=10, help="rows per table")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    report = {"imports": [], "first_prediction": {}}
+    for module in args.modules:
+        try:
+            profile = profile_module(module, args.top)
+        except RuntimeError as e:
+            print(f"import {module}: failed ({e})\n")
+            continue
+        report["imports"].append(profile)
+        print(f"import {module}: {profile['total_ms']:.1f} ms, {profile['modules_imported']} modules")
+        print(f"  {'slowest imports (cumulative)':<48}{'cum ms':>9}{'self ms':>9}")
+        for row in profile["slowest"]:
+            print(f"  {row['module']:<48}{row['cumulative_ms']:>9.1f}{row['self_ms']:>9.1f}")
+        print(f"  {'packages (self time)':<48}{'ms':>9}")
+        for row in profile["packages"]:
+            print(f"  {row['package']:<48}{row['self_ms']:>9.1f}")
+        print()
+
+    for filename in args.models:
+        try:
+            timing = first_prediction(filename)
+        except RuntimeError as e:
+            print(f"first prediction with {filename}: failed ({e})")
+            continue
+        report["first_prediction"][filename] = timing
+        print(f"first prediction with {filename}: {timing['total_ms']:.0f} ms "
+              f"(imports {timing['import_ms']:.0f}, load {timing['load_ms']:.0f}, predict {timing['predict_ms']:.1f}; "
+              f"sklearn {'imported' if timing['sklearn_imported'] else 'not imported'})")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
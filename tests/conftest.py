@@ -0,0 +1,58 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The modules live at the top level of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from registry import MODEL_FILES  # noqa: E402
+from utils import MODEL_DIR, load_model  # noqa: E402
+
+# Gym-style columns of the small models written by ``write_model``
+SMALL_COLUMNS = ['Age', 'BMI', 'Weight']
+
+
+def _write_model(path, seed=0):
+    import joblib
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import LabelEncoder
+
+    rng = np.random.default_rng(seed)
+    X = rng.uniform(0, 100, size=(200, len(SMALL_COLUMNS)))
+    labels = np.where(X[:, 0] > 50, 'high', 'low')
+    encoder = LabelEncoder().fit(labels)
+    forest = RandomForestClassifier(n_estimators=5, max_depth=4, random_state=seed)
+    forest.fit(X, encoder.transform(labels))
+    joblib.dump((forest, encoder, SMALL_COLUMNS), path)
+
+
+def pytest_configure(config):
+    # Feature rows are passed as arrays, as in utils.py
+    config.addinivalue_line("filterwarnings", "ignore:X does not have valid feature names:UserWarning")
+
+
+@pytest.fixture(scope="session", params=list(MODEL_FILES.values()))
+def model_file(request):
+    if not os.path.exists(os.path.join(MODEL_DIR, request.param)):
+        pytest.skip(f"{request.param} is not in the model directory")
+    return request.param
+
+
+@pytest.fixture(scope="session")
+def model(model_file):
+    return load_model(model_file)
+
+
+@pytest.fixture(scope="session")
+def parity_rows(model):
+    from forest_engine import parity_inputs
+
+    return parity_inputs(model)
+
+
+@pytest.fixture
+def write_model():
+    """``write_model(path, seed=0)`` dumps a small forest over SMALL_COLUMNS; ``seed`` changes the model."""
+    return _write_model
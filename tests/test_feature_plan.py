@@ -0,0 +1,174 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_plan import get_plan, get_schema
+from profiles import Profile, random_profile
+
+DIET_COLUMNS = [
+    'Age', 'Weight_kg', 'Height_cm', 'BMI', 'Gender_Female', 'Gender_Male',
+    'Disease_Type_Diabetes', 'Disease_Type_Hypertension', 'Disease_Type_Obesity',
+    'Severity_Mild', 'Severity_Moderate', 'Severity_Severe',
+    'Physical_Activity_Level_Active', 'Physical_Activity_Level_Moderate', 'Physical_Activity_Level_Sedentary',
+    'Dietary_Restrictions_Low_Sodium', 'Dietary_Restrictions_Low_Sugar',
+    'Allergies_Gluten', 'Allergies_Peanuts',
+    'Preferred_Cuisine_Chinese', 'Preferred_Cuisine_Indian', 'Preferred_Cuisine_Italian', 'Preferred_Cuisine_Mexican',
+]
+
+GYM_COLUMNS = [
+    'Age', 'Height', 'Weight', 'BMI', 'Sex_Female', 'Sex_Male',
+    'Hypertension_No', 'Hypertension_Yes', 'Diabetes_No', 'Diabetes_Yes',
+    'Fitness Goal_Weight Gain', 'Fitness Goal_Weight Loss', 'Fitness Goal_Maintain Fitness',
+]
+
+
+def legacy_features(feature_columns, input_data):
+    """The DataFrame mapping predict_with_model used before FeaturePlan, minus its prints."""
+    is_diet_model = 'Weight_kg' in feature_columns or any('Dietary_Restrictions' in col for col in feature_columns)
+    final_input = pd.DataFrame(0, index=[0], columns=feature_columns)
+
+    if is_diet_model:
+        for col in feature_columns:
+            if col in input_data:
+                final_input[col] = input_data[col]
+                continue
+            if col.startswith('Gender_'):
+                key = f"Gender_{col.split('_')[1]}"
+            elif col.startswith('Disease_Type_'):
+                key = f"Disease_Type_{col.split('_')[-1]}"
+            elif col.startswith('Severity_'):
+                key = f"Severity_{col.split('_')[1]}"
+            elif col.startswith('Physical_Activity_Level_'):
+                key = f"Physical_Activity_Level_{col.split('_')[-1]}"
+            elif col.startswith('Dietary_Restrictions_'):
+                key = f"Dietary_Restrictions_{col.split('_')[-1]}"
+            elif col.startswith('Allergies_'):
+                key = f"Allergies_{col.split('_')[1]}"
+            elif col.startswith('Preferred_Cuisine_'):
+                key = f"Preferred_Cuisine_{col.split('_')[2]}"
+            else:
+                continue
+            if key in input_data and input_data[key] == 1:
+                final_input[col] = 1
+    else:
+        for basic_col in ['Age', 'BMI']:
+            if basic_col in feature_columns and basic_col in input_data:
+                final_input[basic_col] = input_data[basic_col]
+
+        if 'Height' in feature_columns:
+            if 'Height' in input_data:
+                final_input['Height'] = input_data['Height']
+            elif 'Height_cm' in input_data:
+                final_input['Height'] = input_data['Height_cm']
+
+        if 'Weight' in feature_columns:
+            if 'Weight' in input_data:
+                final_input['Weight'] = input_data['Weight']
+            elif 'Weight_kg' in input_data:
+                final_input['Weight'] = input_data['Weight_kg']
+
+        for col in feature_columns:
+            if col.startswith('Sex_'):
+                gender_val = col.split('_')[1]
+                if f'Sex_{gender_val}' in input_data and input_data[f'Sex_{gender_val}'] == 1:
+                    final_input[col] = 1
+                elif f'Gender_{gender_val}' in input_data and input_data[f'Gender_{gender_val}'] == 1:
+                    final_input[col] = 1
+
+        for col in feature_columns:
+            for name, disease in (('Hypertension', 'Disease_Type_Hypertension'), ('Diabetes', 'Disease_Type_Diabetes')):
+                if col == f'{name}_Yes':
+                    if disease in input_data:
+                        final_input[col] = input_data[disease]
+                    elif col in input_data:
+                        final_input[col] = input_data[col]
+                if col == f'{name}_No':
+                    if disease in input_data:
+                        final_input[col] = 1 - input_data[disease]
+                    elif col in input_data:
+                        final_input[col] = input_data[col]
+
+        for col in feature_columns:
+            if col == 'Fitness Goal_Weight Loss' and 'Fitness Goal_Lose Weight' in input_data:
+                final_input[col] = input_data['Fitness Goal_Lose Weight']
+            elif col == 'Fitness Goal_Weight Gain' and 'Fitness Goal_Gain Muscle' in input_data:
+                final_input[col] = input_data['Fitness Goal_Gain Muscle']
+            elif col in input_data:
+                final_input[col] = input_data[col]
+
+    if final_input.isnull().values.any():
+        final_input.fillna(0, inplace=True)
+    return final_input.to_numpy(dtype=np.float64)[0]
+
+
+def random_keys(rng, feature_columns):
+    """A random subset of every key the plan (or the legacy mapping) could read."""
+    keys = set(get_plan(feature_columns).source_keys()) | set(feature_columns)
+    keys |= {'Height_cm', 'Weight_kg', 'Sex_Male', 'Sex_Female', 'Gender_Male', 'Gender_Female',
+             'Dietary_Restrictions_Sodium', 'Dietary_Restrictions_Sugar'}
+    return sorted(key for key in keys if rng.random() < 0.6)
+
+
+def random_value(rng):
+    return rng.choice([0, 1, 1, round(rng.uniform(-5, 250), 1)])
+
+
+def profiles(n, seed=0):
+    rng = random.Random(seed)
+    return [Profile.from_form(**random_profile(rng)) for _ in range(n)]
+
+
+@pytest.fixture(params=["diet", "gym"])
+def feature_columns(request):
+    return DIET_COLUMNS if request.param == "diet" else GYM_COLUMNS
+
+
+def test_plan_kind(feature_columns):
+    assert get_plan(feature_columns).kind == ("diet" if feature_columns is DIET_COLUMNS else "gym")
+
+
+def test_apply_matches_legacy_on_profiles(feature_columns):
+    plan = get_plan(feature_columns)
+    for profile in profiles(300):
+        input_data = profile.to_input()
+        np.testing.assert_array_equal(plan.apply(input_data), legacy_features(feature_columns, input_data))
+
+
+def test_apply_matches_legacy_on_partial_inputs(feature_columns):
+    plan = get_plan(feature_columns)
+    rng = random.Random(1)
+    for _ in range(500):
+        input_data = {key: random_value(rng) for key in random_keys(rng, feature_columns)}
+        np.testing.assert_array_equal(plan.apply(input_data), legacy_features(feature_columns, input_data))
+
+
+def test_missing_values_become_zero(feature_columns):
+    input_data = {key: np.nan for key in feature_columns}
+    np.testing.assert_array_equal(get_plan(feature_columns).apply(input_data),
+                                  legacy_features(feature_columns, input_data))
+    assert not get_plan(feature_columns).apply({}).any()
+
+
+def test_apply_frame_matches_legacy(feature_columns):
+    plan = get_plan(feature_columns)
+    rng = random.Random(2)
+    for _ in range(20):
+        keys = random_keys(rng, feature_columns)
+        records = [{key: random_value(rng) for key in keys} for _ in range(25)]
+        expected = np.array([legacy_features(feature_columns, record) for record in records])
+        frame = pd.DataFrame(records, columns=keys)
+        np.testing.assert_array_equal(plan.apply_frame(frame), expected.reshape(len(records), -1))
+        np.testing.assert_array_equal(plan.apply_many(records), expected.reshape(len(records), -1))
+
+
+def test_schema_matches_legacy(feature_columns):
+    schema = get_schema(feature_columns)
+    for profile in profiles(300, seed=3):
+        np.testing.assert_array_equal(schema.apply(profile), legacy_features(feature_columns, profile.to_input()))
+
+
+def test_plans_are_cached_by_column_names(feature_columns):
+    assert get_plan(list(feature_columns)) is get_plan(feature_columns)
+    assert get_schema(list(feature_columns)) is get_schema(feature_columns)
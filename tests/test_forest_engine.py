@@ -0,0 +1,58 @@
+import numpy as np
+
+from forest_engine import CompiledForest, check_parity, compile_model
+
+
+def test_predict_proba_matches_sklearn(model, parity_rows):
+    forest = compile_model(model)[0]
+    np.testing.assert_array_equal(forest.predict_proba(parity_rows), model[0].predict_proba(parity_rows))
+
+
+def test_labels_match_sklearn(model, parity_rows):
+    model_instance, label_encoder, _ = model
+    forest, labels, _ = compile_model(model)
+    expected = label_encoder.inverse_transform(model_instance.predict(parity_rows))
+    np.testing.assert_array_equal(labels.inverse_transform(forest.predict(parity_rows)), expected)
+
+
+def test_check_parity_finds_no_mismatches(model, parity_rows):
+    assert check_parity(model, parity_rows) == 0
+
+
+def test_results_do_not_depend_on_block_size(model, parity_rows):
+    forest = compile_model(model)[0]
+    expected = forest.predict_proba(parity_rows)
+    forest.block_size = 7
+    np.testing.assert_array_equal(forest.predict_proba(parity_rows), expected)
+
+
+def test_compile_model_is_idempotent(model):
+    compiled = compile_model(model)
+    assert isinstance(compiled[0], CompiledForest)
+    assert compile_model(compiled) is compiled
+
+
+def test_large_batches_use_the_kept_estimator(model, parity_rows):
+    forest = compile_model(model, keep_estimator=True)[0]
+    assert forest.estimator is model[0]
+    assert compile_model(model)[0].estimator is None
+    small = parity_rows[:forest.sklearn_rows - 1]
+    np.testing.assert_array_equal(forest.predict_proba(small), model[0].predict_proba(small))
+    np.testing.assert_array_equal(forest.predict_proba(parity_rows), model[0].predict_proba(parity_rows))
+
+    # Below the crossover the estimator is not consulted
+    forest.estimator = object()
+    np.testing.assert_array_equal(forest.predict_proba(small), model[0].predict_proba(small))
+
+
+def test_explain_with_the_estimator_matches_the_traversal(model, parity_rows):
+    forest = compile_model(model)[0]
+    proba, bias, contributions = forest.explain(parity_rows)
+    kept = compile_model(model, keep_estimator=True)[0]
+    for explained in (kept.explain(parity_rows), forest.explain(parity_rows, model[0])):
+        np.testing.assert_array_equal(explained[0], proba)
+        np.testing.assert_array_equal(explained[1], bias)
+        np.testing.assert_allclose(explained[2], contributions, atol=1e-12)
+    np.testing.assert_array_equal(proba, model[0].predict_proba(parity_rows))
+    predicted = proba[np.arange(len(proba)), np.argmax(proba, axis=1)]
+    np.testing.assert_allclose(bias + contributions.sum(axis=1), predicted, atol=1e-9)
@@ -0,0 +1,17 @@
+import pytest
+
+from forest_engine import compile_model
+from lookup_table import _check_layout, build_table
+from model_compact import compact_model
+from model_format import export_model, load_mapped
+
+
+def test_full_forest_layout_is_accepted(model, tmp_path):
+    _check_layout(compile_model(model)[0])
+    export_model(model, tmp_path / "model.fmap")
+    _check_layout(load_mapped(tmp_path / "model.fmap")[0])
+
+
+def test_compact_forest_is_rejected(model):
+    with pytest.raises(ValueError, match="full forest"):
+        build_table(compact_model(model))
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from forest_engine import compile_model
+from model_compact import _float32_floor, compact_model, forest_nbytes
+from model_format import export_model, load_mapped
+
+
+@pytest.fixture(scope="module")
+def compact(model):
+    return compact_model(model)
+
+
+def test_predicts_exactly_like_the_original(model, parity_rows, compact):
+    np.testing.assert_array_equal(compact[0].predict_proba(parity_rows), model[0].predict_proba(parity_rows))
+
+
+def test_is_smaller(model, compact):
+    original = compile_model(model)[0]
+    assert compact[0].n_nodes < original.n_nodes
+    assert forest_nbytes(compact[0]) < forest_nbytes(original)
+    assert compact[0].threshold.dtype == np.float32
+    assert compact[0].children.dtype == np.int32
+
+
+def test_mapped_round_trip(parity_rows, compact, tmp_path):
+    path = tmp_path / "model.compact.fmap"
+    export_model(compact, path)
+    mapped = load_mapped(path)[0]
+    assert mapped.feature.dtype == compact[0].feature.dtype
+    np.testing.assert_array_equal(mapped.predict_proba(parity_rows), compact[0].predict_proba(parity_rows))
+
+
+def test_cannot_be_explained(parity_rows, compact):
+    with pytest.raises(ValueError):
+        compact[0].explain(parity_rows[:1])
+
+
+def test_float32_floor_keeps_comparisons_exact():
+    thresholds = np.array([0.1, 0.5, 1.0 / 3.0, 24.215, -7.3, 1e-8])
+    floored = _float32_floor(thresholds)
+    assert (floored.astype(np.float64) <= thresholds).all()
+    above = np.nextafter(floored, np.float32(np.inf))
+    assert (above.astype(np.float64) > thresholds).all()
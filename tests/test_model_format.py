@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from forest_engine import compile_model
+from model_format import export_model, is_mapped_array, is_mapped_file, load_mapped, read_header
+
+
+@pytest.fixture
+def mapped(model, tmp_path):
+    path = tmp_path / "model.fmap"
+    export_model(model, path, source_sha256="abc123")
+    return path
+
+
+def test_round_trip_predicts_like_sklearn(model, parity_rows, mapped):
+    model_instance, label_encoder, feature_columns = model
+    forest, labels, columns = load_mapped(mapped)
+    np.testing.assert_array_equal(forest.predict_proba(parity_rows), model_instance.predict_proba(parity_rows))
+    np.testing.assert_array_equal(labels.inverse_transform(forest.predict(parity_rows)),
+                                  label_encoder.inverse_transform(model_instance.predict(parity_rows)))
+    assert columns == list(feature_columns)
+
+
+def test_arrays_are_views_of_the_mapping(mapped):
+    forest = load_mapped(mapped)[0]
+    for name in ("feature", "threshold", "children", "value", "roots"):
+        assert is_mapped_array(getattr(forest, name)), name
+    assert not is_mapped_array(np.zeros(3))
+
+
+def test_header_records_the_source(model, mapped):
+    assert is_mapped_file(mapped)
+    header = read_header(mapped)
+    assert header["source_sha256"] == "abc123"
+    assert header["n_features"] == compile_model(model)[0].n_features
+
+
+def test_truncated_file_is_rejected(mapped):
+    data = mapped.read_bytes()
+    mapped.write_bytes(data[:len(data) // 2])
+    with pytest.raises(ValueError):
+        load_mapped(mapped)
@@ -0,0 +1,37 @@
+import random
+
+import pandas as pd
+import pytest
+
+from forest_engine import compile_model
+from profiles import Profile, ProfileBatch, random_profile
+from utils import predict_batch, predict_with_model
+
+
+@pytest.fixture(params=["sklearn", "compiled"])
+def served(request, model):
+    return model if request.param == "sklearn" else compile_model(model)
+
+
+@pytest.fixture(scope="module")
+def profiles():
+    rng = random.Random(0)
+    return [Profile.from_form(**random_profile(rng)) for _ in range(200)]
+
+
+def test_batches_match_single_records(served, profiles):
+    expected = [predict_with_model(served, profile.to_input()) for profile in profiles]
+    assert [predict_with_model(served, profile) for profile in profiles] == expected
+
+    inputs = [profile.to_input() for profile in profiles]
+    assert predict_batch(served, inputs) == expected
+    assert predict_batch(served, pd.DataFrame(inputs)) == expected
+    assert predict_batch(served, ProfileBatch.from_profiles(profiles)) == expected
+    assert predict_batch(served, inputs, explain=True)["labels"] == expected
+
+
+def test_empty_batch(served):
+    keys = list(Profile.from_form(**random_profile(random.Random(0))).to_input())
+    assert predict_batch(served, []) == []
+    assert predict_batch(served, pd.DataFrame(columns=keys)) == []
+    assert predict_batch(served, ProfileBatch.from_profiles([])) == []
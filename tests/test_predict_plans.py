@@ -0,0 +1,42 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import joblib
+
+import utils
+from utils import predict_plans, predict_with_model
+
+
+def test_sessions_share_one_plan_executor(tmp_path, monkeypatch, write_model):
+    write_model(tmp_path / "a.pkl")
+    write_model(tmp_path / "b.pkl", seed=1)
+    models = {"a": joblib.load(tmp_path / "a.pkl"), "b": joblib.load(tmp_path / "b.pkl")}
+    input_data = {"Age": 60, "BMI": 22.0, "Weight": 70.0}
+
+    created = []
+
+    class CountingExecutor(ThreadPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            created.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(utils, "ThreadPoolExecutor", CountingExecutor)
+    monkeypatch.setattr(utils, "_plan_executor", None)
+
+    start = threading.Barrier(8)
+    results = []
+
+    def session():
+        start.wait()
+        results.append(predict_plans(models, input_data, parallel=True))
+
+    threads = [threading.Thread(target=session) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    expected = {name: predict_with_model(model, input_data) for name, model in models.items()}
+    assert [{name: plan["label"] for name, plan in plans.items()} for plans in results] == [expected] * 8
+    created[0].shutdown()
@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+import pytest
+
+import prediction_cache
+import utils
+from prediction_cache import MISSING, PredictionCache
+from registry import default_registry
+from utils import configure_prediction_cache, predict_with_model
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(prediction_cache.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def cache():
+    cache = configure_prediction_cache(maxsize=100, ttl=60)
+    yield cache
+    configure_prediction_cache(maxsize=0)
+
+
+@pytest.fixture
+def served(tmp_path, monkeypatch, write_model):
+    # The cache listens to the process-wide registry, so serve a small model through it
+    write_model(tmp_path / "small.pkl")
+    monkeypatch.setattr(default_registry, "model_dir", str(tmp_path))
+    yield tmp_path / "small.pkl"
+    default_registry.clear()
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = PredictionCache(maxsize=10, ttl=5)
+    cache.put("a", "label")
+    clock.now += 4.9
+    assert cache.get("a") == "label"
+    clock.now += 0.2
+    assert cache.get("a") is MISSING
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PredictionCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is MISSING
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_alias_equivalent_inputs_share_an_entry(cache, served):
+    model = default_registry.get(served.name)
+    first = predict_with_model(model, {"Age": 30, "BMI": 22.0, "Weight_kg": 70.0})
+    assert predict_with_model(model, {"Age": 30, "BMI": 22.0, "Weight": 70.0, "Height_cm": 180.0}) == first
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+
+def test_registry_swap_invalidates_the_model(cache, served, write_model):
+    model = default_registry.get(served.name)
+    input_data = {"Age": 30, "BMI": 22.0, "Weight": 70.0}
+    predict_with_model(model, input_data)
+    assert cache.stats()["size"] == 1
+
+    write_model(served, seed=1)
+    st = os.stat(served)
+    os.utime(served, ns=(st.st_atime_ns, st.st_mtime_ns + 10**10))
+    assert default_registry.get(served.name) is not model
+    assert cache.stats()["size"] == 0
+
+
+def test_cached_explanations_are_copies(cache, served):
+    model = default_registry.get(served.name)
+    input_data = {"Age": 30, "BMI": 22.0, "Weight": 70.0}
+    first = predict_with_model(model, input_data, explain=True)
+    expected = {"label": first["label"], "explanation": dict(first["explanation"])}
+    first["explanation"]["contributions"]["Age"] = np.nan
+    first["explanation"]["bias"] = None
+
+    second = predict_with_model(model, input_data, explain=True)
+    assert cache.stats()["hits"] == 1
+    assert second["explanation"]["bias"] == expected["explanation"]["bias"]
+    assert not np.isnan(second["explanation"]["contributions"]["Age"])
+    second["label"] = "changed"
+    assert predict_with_model(model, input_data, explain=True)["label"] == expected["label"]
+
+
+def test_one_registry_listener(cache):
+    configure_prediction_cache(maxsize=10)
+    assert default_registry._listeners.count(utils._invalidate_cached_model) == 1
@@ -0,0 +1,21 @@
+import random
+
+import numpy as np
+import pytest
+
+from profiles import PROFILE_FIELDS, Profile, ProfileBatch, random_profile
+
+
+def test_profile_needs_every_field():
+    with pytest.raises(TypeError):
+        Profile(1, 2, 3)
+    with pytest.raises(TypeError):
+        Profile(*range(len(PROFILE_FIELDS) + 1))
+    assert Profile(*range(len(PROFILE_FIELDS))).to_array().tolist() == list(range(len(PROFILE_FIELDS)))
+
+
+def test_batch_matches_profiles():
+    rng = random.Random(0)
+    profiles = [Profile.from_form(**random_profile(rng)) for _ in range(10)]
+    batch = ProfileBatch.from_profiles(profiles)
+    np.testing.assert_array_equal(batch.values, [profile.to_array() for profile in profiles])
@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+from registry import ModelRegistry
+from utils import load_model
+
+COLUMNS = ['Age', 'BMI', 'Weight']
+
+
+def bump_mtime(path, seconds=10):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + seconds * 10**9))
+
+
+class CountingLoader:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, path):
+        self.calls.append(path)
+        return load_model(path)
+
+
+@pytest.fixture
+def registry(tmp_path, write_model):
+    write_model(tmp_path / "model.pkl")
+    loader = CountingLoader()
+    registry = ModelRegistry(tmp_path, loader=loader)
+    registry.loader_calls = loader.calls
+    return registry
+
+
+def test_relative_model_dir(tmp_path, monkeypatch, write_model):
+    (tmp_path / "md").mkdir()
+    write_model(tmp_path / "md" / "model.pkl")
+    monkeypatch.chdir(tmp_path)
+    model = ModelRegistry("md").get("model.pkl")
+    assert model[2] == COLUMNS
+
+
+def test_unchanged_file_is_not_reloaded(registry):
+    model = registry.get("model.pkl")
+    assert registry.get("model.pkl") is model
+    bump_mtime(registry.entry("model.pkl").path)
+    assert registry.get("model.pkl") is model
+    assert registry.entry("model.pkl").version == 1
+    assert len(registry.loader_calls) == 1
+
+
+def test_truncated_file_keeps_the_old_model(registry):
+    model = registry.get("model.pkl")
+    path = registry.entry("model.pkl").path
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:len(data) // 2])
+    bump_mtime(path)
+
+    assert registry.get("model.pkl") is model
+    assert registry.entry("model.pkl").version == 1
+    assert registry.error("model.pkl")
+
+
+def test_failed_file_is_not_retried(registry, tmp_path, write_model):
+    broken = tmp_path / "broken.pkl"
+    broken.write_bytes(b"not a model")
+    for _ in range(3):
+        with pytest.raises(Exception):
+            registry.get("broken.pkl")
+    assert registry.loader_calls.count(str(broken)) == 1
+
+    # Until the file changes
+    write_model(broken)
+    bump_mtime(broken)
+    assert registry.get("broken.pkl")[2] == COLUMNS
+
+
+def test_swap_notifies_listeners(registry, write_model):
+    calls = []
+    registry.add_listener(lambda *args: calls.append(args))
+    old = registry.get("model.pkl")
+    path = registry.entry("model.pkl").path
+    write_model(path, seed=1)
+    bump_mtime(path)
+
+    new = registry.get("model.pkl")
+    assert new is not old
+    assert registry.entry("model.pkl").version == 2
+    assert calls == [("model.pkl", old, new)]
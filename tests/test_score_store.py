@@ -0,0 +1,74 @@
+import sqlite3
+
+import joblib
+import pytest
+from sklearn.preprocessing import LabelEncoder
+
+from score_store import IncrementalScorer, ScoreStore
+
+
+@pytest.fixture
+def model(tmp_path, write_model):
+    # Numeric labels, which a TEXT column would turn into strings
+    write_model(tmp_path / "model.pkl")
+    forest, _, feature_columns = joblib.load(tmp_path / "model.pkl")
+    return forest, LabelEncoder().fit([3, 7]), feature_columns
+
+
+@pytest.fixture
+def records():
+    return [{"id": i, "age": 20 + i % 60, "weight": 50.0 + i % 90, "height": 170.0} for i in range(200)]
+
+
+def run(path, model, records, model_sha256="a"):
+    scorer = IncrementalScorer(ScoreStore(str(path)), {"workout_plan": model}, {"workout_plan": model_sha256})
+    try:
+        return scorer.score_chunk(records), scorer
+    finally:
+        scorer.store.close()
+
+
+def test_repeat_run_reuses_every_label(tmp_path, model, records):
+    first, scorer = run(tmp_path / "state.sqlite", model, records)
+    assert (scorer.predicted, scorer.reused) == (len(records), 0)
+    assert {result["workout_plan"] for result in first} <= {3, 7}
+
+    second, scorer = run(tmp_path / "state.sqlite", model, records)
+    assert (scorer.predicted, scorer.reused) == (0, len(records))
+    assert second == first
+    assert [type(result["workout_plan"]) for result in second] == [type(result["workout_plan"]) for result in first]
+
+
+def test_only_changed_records_are_predicted(tmp_path, model, records):
+    run(tmp_path / "state.sqlite", model, records)
+    changed = [dict(record) for record in records]
+    changed[5]["weight"] = 150.0
+    changed[17]["age"] = 90
+    changed[30]["gender"] = "Female"  # not a feature of this model
+
+    results, scorer = run(tmp_path / "state.sqlite", model, changed)
+    assert (scorer.predicted, scorer.reused) == (2, len(records) - 2)
+    fresh, _ = run(tmp_path / "fresh.sqlite", model, changed)
+    assert results == fresh
+
+
+def test_new_model_hash_predicts_everything(tmp_path, model, records):
+    run(tmp_path / "state.sqlite", model, records)
+    _, scorer = run(tmp_path / "state.sqlite", model, records, model_sha256="b")
+    assert (scorer.predicted, scorer.reused) == (len(records), 0)
+
+
+def test_typed_label_column_is_rebuilt(tmp_path):
+    path = tmp_path / "state.sqlite"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE results (id TEXT NOT NULL, output TEXT NOT NULL, fingerprint BLOB NOT NULL, "
+                 "model_sha256 TEXT NOT NULL, label TEXT, scored_at REAL NOT NULL, PRIMARY KEY (id, output))")
+    conn.execute("INSERT INTO results VALUES ('1', 'workout_plan', x'00', 'a', '3', 0)")
+    conn.commit()
+    conn.close()
+
+    store = ScoreStore(str(path))
+    assert store.count() == 0
+    store.save("workout_plan", [("1", b"\0", "a", 3)])
+    assert store.lookup("workout_plan", ["1"])["1"][2] == 3
+    store.close()
@@ -1,23 +1,56 @@
-import joblib
+import logging
 import os
-import pandas as pd
-import pickle
 import numpy as np
+import threading
+import time
+import traceback
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from feature_plan import get_plan, get_schema, get_shared_plan
+from forest_engine import explainer_for
+from instrumentation import NULL_TIMER, start_timer
+from model_format import is_mapped_file, load_mapped
+from prediction_cache import MISSING, PredictionCache
+from profiles import Profile, ProfileBatch
+
+# Features are passed to the models as arrays in feature_columns order, so
+# sklearn's feature-name check has nothing to add.
+warnings.filterwarnings("ignore", message="X does not have valid feature names", category=UserWarning)
+
+logger = logging.getLogger(__name__)
 
 # Base directory = where utils.py is located
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_DIR = os.path.join(BASE_DIR, "model")
 
+# Opt-in cache used by predict_with_model (see configure_prediction_cache)
+_prediction_cache = None
+_cache_listener_added = False
+
+# Threads used by predict_plans to run models side by side, created once
+# under the lock by the first session that needs them
+_plan_executor = None
+_plan_executor_lock = threading.Lock()
+
 
 def load_model(filename):
-    """Load a model from the model directory."""
-    model_path = os.path.join(MODEL_DIR, filename)
+    """Load a model from the model directory, or from ``filename`` if it is an absolute path."""
+    model_path = filename if os.path.isabs(filename) else os.path.join(MODEL_DIR, filename)
 
     if not os.path.exists(model_path):
         raise FileNotFoundError(f"Model file not found at: {model_path}")
 
     # Load and return the model
     try:
+        if is_mapped_file(model_path):
+            # Exported with model_format.py: map it instead of unpickling
+            return load_mapped(model_path)
+        # Imported on first use: joblib (and sklearn, while unpickling) dominate
+        # the import time of this module otherwise
+        import joblib
+        import pickle
+
         with open(model_path, 'rb') as f:
             # Try both joblib and pickle
             try:
@@ -31,166 +64,298 @@ def load_model(filename):
         raise Exception(f"Failed to load model '{filename}': {str(e)}")
 
 
-def predict_with_model(model, input_data):
-    """Make a prediction using the trained model."""
+def configure_prediction_cache(maxsize=10000, ttl=3600.0):
+    """Enable (or with ``maxsize=0`` disable) the prediction cache; return it.
+
+    The cache is cleared for a model whenever the model registry swaps it.
+    """
+    global _prediction_cache, _cache_listener_added
+    if not maxsize:
+        _prediction_cache = None
+        return None
+
+    if not _cache_listener_added:
+        from registry import default_registry
+
+        # One listener for the process, so replaced caches are not kept alive
+        default_registry.add_listener(_invalidate_cached_model)
+        _cache_listener_added = True
+    _prediction_cache = PredictionCache(maxsize, ttl)
+    return _prediction_cache
+
+
+def _invalidate_cached_model(filename, old_model, new_model):
+    cache = _prediction_cache
+    if cache is not None:
+        cache.invalidate(old_model[0])
+
+
+def get_prediction_cache():
+    """Return the active prediction cache, or None when caching is off."""
+    return _prediction_cache
+
+
+def predict_with_model(model, input_data, explain=False):
+    """Make a prediction using the trained model.
+
+    ``input_data`` is a ``Profile`` or a legacy input dict (see encode_profile).
+    With ``explain``, return ``{"label", "explanation"}``, where the explanation
+    holds the class probabilities and each feature's contribution to the
+    predicted class (see explain_row), or is None if the model cannot be
+    explained (e.g. a compact forest).
+    """
+    timer = NULL_TIMER
     try:
         model_instance, label_encoder, feature_columns = model
 
-        # Debug information
-        print(f"Input data keys: {list(input_data.keys())}")
-        print(f"Expected feature columns: {feature_columns}")
-
-        # Determine which model we're dealing with based on the feature columns
-        is_diet_model = 'Weight_kg' in feature_columns or any('Dietary_Restrictions' in col for col in feature_columns)
-
-        # Create a DataFrame with zeros for all model features
-        final_input = pd.DataFrame(0, index=[0], columns=feature_columns)
-
-        # For Diet Model
-        if is_diet_model:
-            print("Using Diet Model mapping")
-
-            # Map the direct matching columns
-            for col in feature_columns:
-                if col in input_data:
-                    final_input[col] = input_data[col]
-                    continue
-
-                # Handle gender columns
-                if col.startswith('Gender_'):
-                    gender_val = col.split('_')[1]  # Get Male or Female
-                    if f'Gender_{gender_val}' in input_data and input_data[f'Gender_{gender_val}'] == 1:
-                        final_input[col] = 1
-                    continue
-
-                # Handle disease columns
-                if col.startswith('Disease_Type_'):
-                    disease = col.split('_')[-1]  # Get disease name
-                    if f'Disease_Type_{disease}' in input_data and input_data[f'Disease_Type_{disease}'] == 1:
-                        final_input[col] = 1
-                    continue
-
-                # Handle severity columns
-                if col.startswith('Severity_'):
-                    severity_val = col.split('_')[1]  # Get severity level
-                    if f'Severity_{severity_val}' in input_data and input_data[f'Severity_{severity_val}'] == 1:
-                        final_input[col] = 1
-                    continue
-
-                # Handle activity level columns
-                if col.startswith('Physical_Activity_Level_'):
-                    activity = col.split('_')[-1]  # Get activity level
-                    if f'Physical_Activity_Level_{activity}' in input_data and input_data[
-                        f'Physical_Activity_Level_{activity}'] == 1:
-                        final_input[col] = 1
-                    continue
-
-                # Handle dietary restrictions
-                if col.startswith('Dietary_Restrictions_'):
-                    restriction = col.split('_')[-1]  # Get restriction
-                    if f'Dietary_Restrictions_{restriction}' in input_data and input_data[
-                        f'Dietary_Restrictions_{restriction}'] == 1:
-                        final_input[col] = 1
-                    continue
-
-                # Handle allergies
-                if col.startswith('Allergies_'):
-                    allergy = col.split('_')[1]  # Get allergy
-                    if f'Allergies_{allergy}' in input_data and input_data[f'Allergies_{allergy}'] == 1:
-                        final_input[col] = 1
-                    continue
-
-                # Handle preferred cuisine
-                if col.startswith('Preferred_Cuisine_'):
-                    cuisine = col.split('_')[2]  # Get cuisine
-                    if f'Preferred_Cuisine_{cuisine}' in input_data and input_data[f'Preferred_Cuisine_{cuisine}'] == 1:
-                        final_input[col] = 1
-                    continue
-
-        # For Gym Model
+        # The column mapping rules are compiled once per model (see feature_plan.py)
+        plan = get_plan(feature_columns)
+        timer = start_timer(plan.kind)
+
+        # Debug information, only formatted when DEBUG logging is on
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Input data: %r", input_data if isinstance(input_data, Profile) else list(input_data.keys()))
+            logger.debug("Expected feature columns: %s", feature_columns)
+            logger.debug("Using %s Model mapping", plan.kind.capitalize())
+
+        if isinstance(input_data, Profile):
+            final_input = get_schema(feature_columns).apply(input_data).reshape(1, -1)
         else:
-            print("Using Gym Model mapping")
-
-            # Handle basic metrics
-            for basic_col in ['Age', 'BMI']:
-                if basic_col in feature_columns and basic_col in input_data:
-                    final_input[basic_col] = input_data[basic_col]
-
-            # Handle height and weight
-            if 'Height' in feature_columns:
-                if 'Height' in input_data:
-                    final_input['Height'] = input_data['Height']
-                elif 'Height_cm' in input_data:
-                    final_input['Height'] = input_data['Height_cm']
-
-            if 'Weight' in feature_columns:
-                if 'Weight' in input_data:
-                    final_input['Weight'] = input_data['Weight']
-                elif 'Weight_kg' in input_data:
-                    final_input['Weight'] = input_data['Weight_kg']
-
-            # Handle gender/sex columns
-            for col in feature_columns:
-                if col.startswith('Sex_'):
-                    gender_val = col.split('_')[1]  # Get Male or Female
-
-                    # Try to map from either Sex_ or Gender_ fields in input
-                    if f'Sex_{gender_val}' in input_data and input_data[f'Sex_{gender_val}'] == 1:
-                        final_input[col] = 1
-                    elif f'Gender_{gender_val}' in input_data and input_data[f'Gender_{gender_val}'] == 1:
-                        final_input[col] = 1
-
-            # Handle hypertension and diabetes
-            for col in feature_columns:
-                if col == 'Hypertension_Yes':
-                    if 'Disease_Type_Hypertension' in input_data:
-                        final_input[col] = input_data['Disease_Type_Hypertension']
-                    elif 'Hypertension_Yes' in input_data:
-                        final_input[col] = input_data['Hypertension_Yes']
-
-                if col == 'Hypertension_No':
-                    if 'Disease_Type_Hypertension' in input_data:
-                        final_input[col] = 1 - input_data['Disease_Type_Hypertension']
-                    elif 'Hypertension_No' in input_data:
-                        final_input[col] = input_data['Hypertension_No']
-
-                if col == 'Diabetes_Yes':
-                    if 'Disease_Type_Diabetes' in input_data:
-                        final_input[col] = input_data['Disease_Type_Diabetes']
-                    elif 'Diabetes_Yes' in input_data:
-                        final_input[col] = input_data['Diabetes_Yes']
-
-                if col == 'Diabetes_No':
-                    if 'Disease_Type_Diabetes' in input_data:
-                        final_input[col] = 1 - input_data['Disease_Type_Diabetes']
-                    elif 'Diabetes_No' in input_data:
-                        final_input[col] = input_data['Diabetes_No']
-
-            # Handle fitness goals
-            for col in feature_columns:
-                if col == 'Fitness Goal_Weight Loss' and 'Fitness Goal_Lose Weight' in input_data:
-                    final_input[col] = input_data['Fitness Goal_Lose Weight']
-                elif col == 'Fitness Goal_Weight Gain' and 'Fitness Goal_Gain Muscle' in input_data:
-                    final_input[col] = input_data['Fitness Goal_Gain Muscle']
-                elif col in input_data:
-                    final_input[col] = input_data[col]
-
-        # Debugging output
-        print(f"Final input shape: {final_input.shape}")
-        print(f"Final input columns: {list(final_input.columns)}")
-
-        # Check for missing values and fill with 0
-        if final_input.isnull().values.any():
-            print("Warning: Input contains missing values. Filling with zeros.")
-            final_input.fillna(0, inplace=True)
+            final_input = plan.apply(input_data).reshape(1, -1)
+        timer.mark("mapping")
+
+        _check_features(feature_columns, final_input)
+        timer.mark("validation")
+        logger.debug("Final input shape: %s", final_input.shape)
+
+        predicted_label = _predict_row(model_instance, label_encoder, final_input, timer,
+                                       feature_columns if explain else None)
+        timer.finish()
+        return predicted_label
 
+    except Exception as e:
+        timer.finish(error=True)
+        logger.debug("Prediction failed", exc_info=True)
+        raise Exception(f"Prediction failed: {str(e)}")
+
+
+def _check_features(feature_columns, features):
+    # plan.apply already turns missing values into zeros; infinities remain
+    if not np.isfinite(features).all():
+        bad = sorted({feature_columns[i] for i in np.nonzero(~np.isfinite(features))[-1]})
+        raise ValueError(f"Non-finite values for {', '.join(bad)}")
+
+
+def _predict_row(model_instance, label_encoder, final_input, timer=NULL_TIMER, explain_columns=None):
+    # Shared by predict_with_model and predict_plans; goes through the cache if enabled.
+    # With explain_columns (the model's feature columns) returns {"label", "explanation"}
+    explain = explain_columns is not None
+    cache = _prediction_cache
+    if cache is not None:
+        cache_key = cache.make_key(model_instance, final_input)
+        if explain:
+            cache_key += ("explain",)
+        cached_label = cache.get(cache_key)
+        if cached_label is not MISSING:
+            timer.mark("cache")
+            return _copy_result(cached_label)
+
+    explanation = None
+    if explain:
+        try:
+            explanation = explain_row(explain_rows(model_instance, label_encoder, final_input, timer), 0,
+                                      explain_columns)
+        except Exception as e:
+            # Still predict the plan when only its explanation is unavailable
+            logger.debug("Cannot explain the prediction: %s", e)
+    if explanation is not None:
+        predicted_label = explanation["label"]
+    else:
         # Make prediction
         prediction = model_instance.predict(final_input)
+        timer.mark("predict")
         predicted_label = label_encoder.inverse_transform(prediction)[0]
+        timer.mark("inverse_transform")
+    if explain:
+        predicted_label = {"label": predicted_label, "explanation": explanation}
+
+    if cache is not None:
+        cache.put(cache_key, predicted_label)
+        predicted_label = _copy_result(predicted_label)
+
+    return predicted_label
+
+
+def _copy_result(result):
+    # Cached explanations are shared; every caller gets its own dicts
+    if not isinstance(result, dict):
+        return result
+    explanation = result["explanation"]
+    if explanation is not None:
+        explanation = {key: dict(value) if isinstance(value, dict) else value for key, value in explanation.items()}
+    return {"label": result["label"], "explanation": explanation}
+
+
+def explain_rows(model_instance, label_encoder, features, timer=NULL_TIMER):
+    """Predict and explain a feature matrix in one pass over the forest.
+
+    Returns a dict of ``labels``, ``classes`` (the labels of the probability
+    columns), ``probabilities`` (n_rows, n_classes), and ``bias`` (n_rows)
+    and ``contributions`` (n_rows, n_features) for the predicted class: its
+    probability is the bias plus the sum of the row's contributions. The
+    explained ``features`` are included as well.
+
+    sklearn models are compiled on first use (see explainer_for) and find
+    the leaves of large batches themselves, so a batch costs about as much
+    as a plain prediction with either kind of model; compact and mapped
+    forests walk their own trees, which is slower on large batches.
+    """
+    forest = explainer_for(model_instance)
+    estimator = None if forest is model_instance else model_instance
+    probabilities, bias, contributions = forest.explain(features, estimator)
+    timer.mark("predict")
+    classes = label_encoder.inverse_transform(forest.classes_)
+    labels = classes[np.argmax(probabilities, axis=1)]
+    timer.mark("inverse_transform")
+    return {
+        "labels": labels.tolist(),
+        "classes": classes.tolist(),
+        "probabilities": probabilities,
+        "bias": bias,
+        "contributions": contributions,
+        "features": features,
+    }
+
+
+def explain_row(explained, index, feature_columns=None):
+    """Return one row of ``explain_rows`` output as a dict.
+
+    ``contributions`` maps each feature (a column name, or its position
+    without ``feature_columns``) to its contribution, largest magnitude first;
+    ``values`` maps it to the row's value.
+    """
+    names = feature_columns if feature_columns is not None else range(explained["contributions"].shape[1])
+    contributions = sorted(zip(names, explained["contributions"][index].tolist()), key=lambda item: -abs(item[1]))
+    return {
+        "label": explained["labels"][index],
+        "probabilities": dict(zip(explained["classes"], explained["probabilities"][index].tolist())),
+        "bias": float(explained["bias"][index]),
+        "contributions": dict(contributions),
+        "values": dict(zip(names, explained["features"][index].tolist())),
+    }
+
+
+def _releases_gil(model_instance):
+    # sklearn forests walk their trees in Cython without the GIL; the NumPy
+    # compiled forest is dominated by Python overhead on single rows
+    return getattr(model_instance, 'releases_gil', hasattr(model_instance, 'estimators_'))
+
+
+def predict_plans(models, input_data, parallel=None, explain=False):
+    """Predict with several models from one encoding pass over ``input_data``.
+
+    ``models`` maps a name (e.g. "gym", "diet") to a model tuple. The input is
+    encoded once into a representation shared by all models, then the models
+    run on a thread pool when their predict releases the GIL (or when
+    ``parallel`` is True), and one after the other otherwise.
+
+    Returns ``{name: {"label", "explanation", "seconds", "error", "traceback"}}``;
+    a failing model reports its error without affecting the others. The
+    ``explanation`` (see explain_row) is only computed with ``explain``, and
+    stays None for a model that cannot be explained.
+    """
+    global _plan_executor
+    names = list(models)
+    timer = start_timer("shared")
+    if isinstance(input_data, Profile):
+        # A profile already holds each value once; every model gathers from it
+        values = input_data.to_array()
+        rows = [get_schema(models[name][2]).apply_values(values) for name in names]
+    else:
+        rows = get_shared_plan([models[name][2] for name in names]).apply(input_data)
+    timer.mark("mapping")
+
+    def run(name, row):
+        model_instance, label_encoder, feature_columns = models[name]
+        start = time.perf_counter()
+        timer = start_timer(name)
+        result = {"label": None, "explanation": None, "error": None, "traceback": None}
+        try:
+            row = row.reshape(1, -1)
+            _check_features(feature_columns, row)
+            timer.mark("validation")
+            prediction = _predict_row(model_instance, label_encoder, row, timer,
+                                      feature_columns if explain else None)
+            if explain:
+                result["explanation"] = prediction["explanation"]
+                prediction = prediction["label"]
+            result["label"] = prediction
+            timer.finish()
+        except Exception as e:
+            timer.finish(error=True)
+            result["error"] = f"Prediction failed: {str(e)}"
+            result["traceback"] = traceback.format_exc()
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    if parallel is None:
+        parallel = len(names) > 1 and all(_releases_gil(models[name][0]) for name in names)
+
+    if not parallel:
+        return {name: run(name, row) for name, row in zip(names, rows)}
+
+    executor = _plan_executor
+    if executor is None:
+        with _plan_executor_lock:
+            if _plan_executor is None:
+                _plan_executor = ThreadPoolExecutor(max(2, len(names)), thread_name_prefix="plan")
+            executor = _plan_executor
+    futures = {name: executor.submit(run, name, row) for name, row in zip(names, rows)}
+    return {name: future.result() for name, future in futures.items()}
+
+
+def predict_batch(model, records, explain=False):
+    """Predict labels for a ``ProfileBatch``, a list of input dicts or a DataFrame of raw profiles.
+
+    All records are mapped into one feature matrix and scored with a single
+    model call; the labels match calling predict_with_model on each record.
+    With ``explain``, return the dict of ``explain_rows`` plus the model's
+    ``feature_columns`` instead of the list of labels; for a model that
+    cannot be explained, ``classes``, ``probabilities``, ``bias`` and
+    ``contributions`` are None.
+    """
+    timer = NULL_TIMER
+    try:
+        model_instance, label_encoder, feature_columns = model
 
-        return predicted_label
+        plan = get_plan(feature_columns)
+        timer = start_timer(plan.kind)
+        if isinstance(records, ProfileBatch):
+            features = get_schema(feature_columns).apply_batch(records)
+        else:
+            features = plan.apply_many(records)
+        timer.mark("mapping")
+        if explain:
+            try:
+                explained = explain_rows(model_instance, label_encoder, features, timer)
+                explained["feature_columns"] = list(feature_columns)
+                timer.finish(rows=len(features))
+                return explained
+            except Exception as e:
+                logger.debug("Cannot explain the batch: %s", e)
+        if len(features) == 0:
+            labels = []
+        else:
+            prediction = model_instance.predict(features)
+            timer.mark("predict")
+            labels = label_encoder.inverse_transform(prediction).tolist()
+            timer.mark("inverse_transform")
+        timer.finish(rows=len(labels))
+        if explain:
+            return {"labels": labels, "classes": None, "probabilities": None, "bias": None, "contributions": None,
+                    "features": features, "feature_columns": list(feature_columns)}
+        return labels
 
     except Exception as e:
-        import traceback
-        print(traceback.format_exc())
-        raise Exception(f"Prediction failed: {str(e)}")
\ No newline at end of file
+        timer.finish(error=True)
+        raise Exception(f"Batch prediction failed: {str(e)}")